@@ -0,0 +1,151 @@
+"""
+Areas of interest of a trial: the rectangle around the characters of
+interest and the character and word areas of a text stimulus.
+
+The regions are built from the glyph vertices of the TextBox2 (see
+layout.py) and stored as intervals sorted by line and x position, so
+looking up the region of a gaze position is a binary search. The lookups
+work on single positions (online, during the experiment) as well as on
+whole arrays of fixation positions (offline). Only NumPy is needed, so this
+module can be used without PsychoPy or PyGaze.
+"""
+
+from typing import List, Tuple
+
+import constants
+import numpy as np
+
+
+# Line width used to give every line its own range of search keys
+LINE_STRIDE = 1e7
+
+
+class RectangleAOI:
+    """
+    Rectangular area of interest with the interface of
+    pygaze.plugins.aoi.AOI("rectangle", pos, size): pos is the top left
+    corner and contains() excludes the border.
+    """
+
+    def __init__(self, pos: Tuple[float, float], size: Tuple[float, float]):
+        self.pos = pos
+        self.size = size
+
+    def contains(self, pos: Tuple[float, float]) -> bool:
+        return (
+            self.pos[0] < pos[0] < self.pos[0] + self.size[0]
+            and self.pos[1] < pos[1] < self.pos[1] + self.size[1]
+        )
+
+
+class TextAOIs:
+    def __init__(
+        self,
+        text: str,
+        vertices: np.ndarray,
+        offset: Tuple[float, float] = tuple(np.array(constants.DISPSIZE) / 2),
+        padding: Tuple[float, float] = (7, 15),
+    ):
+        """
+        vertices are the four corners of every character of text, as in
+        TextBox2.verticesPix. offset is added to them to get screen
+        coordinates, like for the AOI in layout.prepare_trial(). padding
+        extends words horizontally and lines vertically.
+        """
+        self.text = text
+        corners = np.asarray(vertices, dtype=float).reshape(len(text), 4, 2) + offset
+        lefts = corners[:, :, 0].min(axis=1)
+        rights = corners[:, :, 0].max(axis=1)
+        tops = corners[:, :, 1].min(axis=1)
+        bottoms = corners[:, :, 1].max(axis=1)
+
+        # A character that starts left of its predecessor starts a new line
+        line_breaks = np.cumsum(np.diff(lefts) < 0)
+        self.char_lines = np.concatenate(([0], line_breaks)).astype(int)
+        n_lines = self.char_lines[-1] + 1 if len(text) else 0
+        line_tops = np.array(
+            [tops[self.char_lines == line].min() for line in range(n_lines)]
+        )
+        line_bottoms = np.array(
+            [bottoms[self.char_lines == line].max() for line in range(n_lines)]
+        )
+        # Where the padding of neighbouring lines overlaps, split it halfway
+        between = (line_bottoms[:-1] + line_tops[1:]) / 2
+        self.line_tops = np.append(
+            line_tops[:1] - padding[1], np.maximum(line_tops[1:] - padding[1], between)
+        )
+        self.line_bottoms = np.append(
+            np.minimum(line_bottoms[:-1] + padding[1], between),
+            line_bottoms[-1:] + padding[1],
+        )
+
+        # Characters reach to the start of the next character on the same line
+        same_line = np.append(self.char_lines[1:] == self.char_lines[:-1], False)
+        self.char_lefts = lefts
+        self.char_rights = np.where(same_line, np.append(lefts[1:], 0), rights)
+
+        # Words are runs of non-space characters on the same line
+        is_space = np.array([char.isspace() for char in text], dtype=bool)
+        line_starts = np.append(True, ~same_line[:-1]) if len(text) else same_line
+        word_starts = np.flatnonzero(
+            ~is_space & (np.append(True, is_space[:-1]) | line_starts)
+        )
+        word_ends = (
+            np.flatnonzero(~is_space & (np.append(is_space[1:], True) | ~same_line)) + 1
+        )
+        self.word_spans: List[Tuple[int, int]] = list(
+            zip(word_starts.tolist(), word_ends.tolist())
+        )
+        self.words = [text[start:end] for start, end in self.word_spans]
+        self.word_lines = self.char_lines[word_starts]
+        self.word_lefts = self.char_lefts[word_starts] - padding[0]
+        self.word_rights = self.char_rights[word_ends - 1] + padding[0]
+        # Index of the word every character belongs to (-1 for spaces)
+        self.char_words = np.full(len(text), -1)
+        for word, (start, end) in enumerate(self.word_spans):
+            self.char_words[start:end] = word
+
+        self.char_keys = self.char_lines * LINE_STRIDE + self.char_lefts
+        self.word_keys = self.word_lines * LINE_STRIDE + self.word_lefts
+
+    def lines_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        line = np.searchsorted(self.line_tops, ys, side="right") - 1
+        inside = (line >= 0) & (ys <= self.line_bottoms[np.maximum(line, 0)])
+        return np.where(inside, line, -1)
+
+    def lookup(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        keys: np.ndarray,
+        lines: np.ndarray,
+        rights: np.ndarray,
+    ) -> np.ndarray:
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        if len(keys) == 0:
+            return np.full(xs.shape, -1)
+        line = self.lines_at(xs, ys)
+        index = np.searchsorted(keys, line * LINE_STRIDE + xs, side="right") - 1
+        found = np.maximum(index, 0)
+        hit = (line >= 0) & (index >= 0) & (lines[found] == line) & (xs < rights[found])
+        return np.where(hit, index, -1)
+
+    def chars_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Index of the character at every position, -1 outside the text.
+        """
+        return self.lookup(xs, ys, self.char_keys, self.char_lines, self.char_rights)
+
+    def words_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Index (into self.words) of the word at every position, -1 outside of
+        all words.
+        """
+        return self.lookup(xs, ys, self.word_keys, self.word_lines, self.word_rights)
+
+    def char_at(self, x: float, y: float) -> int:
+        return int(self.chars_at([x], [y])[0])
+
+    def word_at(self, x: float, y: float) -> int:
+        return int(self.words_at([x], [y])[0])
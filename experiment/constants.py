@@ -25,6 +25,7 @@ DUMMYMODE = True # False for gaze contingent display, True for dummy mode (using
 LOGFILENAME = 'log' # logfilename, without path
 LOGFILE = LOGFILENAME[:] # .txt; adding path before logfilename is optional; logs responses (NOT eye movements, these are stored in an EDF file!)
 TRIALS = 5
+LOGFORMATS = ('tsv',)  # 'tsv' and/or 'npz', participant log formats (see logger.py)
 
 # DISPLAY
 # used in libscreen, for the *_display functions. The values may be adjusted,
@@ -66,6 +67,10 @@ JOYTIMEOUT = None # None for no timeout, or a value in milliseconds
 TRACKERTYPE = 'smi' # either 'smi', 'eyelink' or 'dummy' (NB: if DUMMYMODE is True, trackertype will be set to dummy automatically)
 SACCVELTHRESH = 35 # degrees per second, saccade velocity threshold
 SACCACCTHRESH = 9500 # degrees per second, saccade acceleration threshold
+# online fixation detection (see gaze.py)
+FIXDISPERSION = 25  # pixels, maximum dispersion of the gaze samples within a fixation
+FIXDURATION = 150  # milliseconds, minimum duration of a fixation
+GAZESAMPLERATE = 500  # Herz, gaze sampling rate of the online fixation detection
 # EyeLink only
 # SMI only
 SMIIP = '127.0.0.1'
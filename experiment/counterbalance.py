@@ -0,0 +1,362 @@
+#! /usr/bin/python3
+
+"""
+Precompute counterbalanced trial lists for a cohort of participants.
+
+Use like this:
+python3 counterbalance.py --participants 2000 --seed 1
+
+Conditions are assigned like in data/latin_square.tsv, generalized to any
+number of conditions: participant p sees the i-th item in condition
+(i + p) mod K, where K is the number of condition columns in stimuli.tsv.
+Every K consecutive participants therefore see every item in every
+condition once. The order of the trials is random, but reproducible: it
+only depends on --seed and the participant id, so lists can be generated in
+any batches. The orders keep to the constraints
+
+--leading-fillers  the first trials are fillers
+--max-run          at most this many experimental items in a row
+--max-condition-run  at most this many items of the same condition in a row
+
+Each list is validated (every item and filler exactly once, constraints
+met) before it is written to data/lists/participant_{id}.tsv, which
+experiment.py loads instead of shuffling the latin square row itself.
+data/lists/index.json records the seed and parameters of the lists and the
+ranges of participant ids [start, stop) they exist for.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from stimuli import LIST_COLUMNS, list_filename
+
+
+LIST_VERSION = 1
+FILLER = "F"
+
+
+class Design(NamedTuple):
+    items: List[int]  # item numbers
+    conditions: List[str]  # condition names (columns of stimuli.tsv)
+    texts: Dict[int, Dict[str, str]]  # item -> condition -> stimulus text
+    fillers: Dict[int, str]  # filler number -> stimulus text
+
+
+class Trial(NamedTuple):
+    item: str  # item number, or FILLER
+    condition: str  # condition name, or filler number
+    stimulus: str
+
+
+def read_design(data_folder: str) -> Design:
+    """
+    Items, conditions and fillers from stimuli.tsv and filler.tsv. The
+    conditions are all columns after Item and Stimulus.
+    """
+    with open(
+        os.path.join(data_folder, "stimuli.tsv"), encoding="utf8", newline=""
+    ) as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        conditions = reader.fieldnames[2:]
+        texts = {}
+        for row in reader:
+            texts[int(row["Item"])] = {
+                condition: row["Stimulus"].format(*row[condition].split(","))
+                for condition in conditions
+            }
+    with open(
+        os.path.join(data_folder, "filler.tsv"), encoding="utf8", newline=""
+    ) as f:
+        fillers = {int(row[0]): row[1] for row in csv.reader(f, delimiter="\t") if row}
+    return Design(sorted(texts), conditions, texts, fillers)
+
+
+def assigned_conditions(design: Design, participant_id: int) -> List[str]:
+    """
+    Condition of every item for the participant (the latin square row).
+    """
+    k = len(design.conditions)
+    return [
+        design.conditions[(i + participant_id) % k] for i in range(len(design.items))
+    ]
+
+
+def gap_sizes(
+    rng: np.random.Generator, items: int, gaps: int, max_run: int
+) -> np.ndarray:
+    """
+    Random numbers of items in each of gaps gaps (between fillers) that add
+    up to items, with at most max_run in each gap.
+    """
+    sizes = np.zeros(gaps, dtype=int)
+    remaining = items
+    for gap in range(gaps):
+        left = gaps - gap - 1
+        low = max(0, remaining - max_run * left)
+        high = min(max_run, remaining)
+        sizes[gap] = rng.integers(low, high + 1)
+        remaining -= sizes[gap]
+    return rng.permutation(sizes)
+
+
+def longest_run(values: List[str]) -> int:
+    longest = run = 0
+    previous = None
+    for value in values:
+        run = run + 1 if value == previous else 1
+        previous = value
+        longest = max(longest, run)
+    return longest
+
+
+def condition_runs_ok(trials: List[Trial], max_condition_run: int) -> bool:
+    conditions = [trial.condition if trial.item != FILLER else None for trial in trials]
+    run = 0
+    previous = None
+    for condition in conditions:
+        run = run + 1 if condition is not None and condition == previous else 1
+        previous = condition
+        if condition is not None and run > max_condition_run:
+            return False
+    return True
+
+
+def participant_list(design: Design, participant_id: int, args: dict) -> List[Trial]:
+    """
+    Trial list of the participant: the items in their assigned conditions
+    and all fillers, in a random order that keeps to the constraints.
+    """
+    rng = np.random.default_rng([args["seed"], participant_id])
+    conditions = assigned_conditions(design, participant_id)
+    items = [
+        Trial(str(item), condition, design.texts[item][condition])
+        for item, condition in zip(design.items, conditions)
+    ]
+    fillers = [
+        Trial(FILLER, str(number), text)
+        for number, text in sorted(design.fillers.items())
+    ]
+    leading = min(args["leading_fillers"], len(fillers))
+    # Items go into the gaps after the leading fillers: between two fillers or at
+    # the end
+    gaps = len(fillers) - leading + 1
+    if len(items) > gaps * args["max_run"]:
+        raise ValueError(
+            f"{len(items)} items don't fit between {len(fillers)} fillers with"
+            f" --max-run {args['max_run']}"
+        )
+
+    for _ in range(args["attempts"]):
+        item_order = rng.permutation(len(items))
+        filler_order = rng.permutation(len(fillers))
+        sizes = gap_sizes(rng, len(items), gaps, args["max_run"])
+        trials = [fillers[i] for i in filler_order[:leading]]
+        next_item = 0
+        for gap, size in enumerate(sizes):
+            trials.extend(items[i] for i in item_order[next_item:next_item + size])
+            next_item += size
+            if leading + gap < len(fillers):
+                trials.append(fillers[filler_order[leading + gap]])
+        if condition_runs_ok(trials, args["max_condition_run"]):
+            return trials
+    raise ValueError(
+        f"no order for participant {participant_id} within {args['attempts']} attempts,"
+        " the constraints may be too strict"
+    )
+
+
+def validate_list(
+    design: Design, participant_id: int, trials: List[Trial], args: dict
+) -> List[str]:
+    """
+    Problems with a trial list (empty if it is fine).
+    """
+    problems = []
+    expected = {
+        (str(item), condition)
+        for item, condition in zip(
+            design.items, assigned_conditions(design, participant_id)
+        )
+    } | {(FILLER, str(number)) for number in design.fillers}
+    seen = [(trial.item, trial.condition) for trial in trials]
+    if len(seen) != len(set(seen)):
+        problems.append("repeated trials")
+    if set(seen) != expected:
+        problems.append("items or conditions differ from the latin square")
+    for trial in trials:
+        if trial.item == FILLER:
+            text = design.fillers.get(int(trial.condition))
+        else:
+            text = design.texts.get(int(trial.item), {}).get(trial.condition)
+        if trial.stimulus != text:
+            problems.append(f"wrong stimulus text for {trial.item}/{trial.condition}")
+    leading = min(args["leading_fillers"], len(design.fillers))
+    if any(trial.item != FILLER for trial in trials[:leading]):
+        problems.append(f"the first {leading} trials are not all fillers")
+    # Fillers get their own labels, so only runs of experimental items count
+    labels = [
+        "item" if trial.item != FILLER else str(i) for i, trial in enumerate(trials)
+    ]
+    if longest_run(labels) > args["max_run"]:
+        problems.append(f"more than {args['max_run']} items in a row")
+    if not condition_runs_ok(trials, args["max_condition_run"]):
+        problems.append(
+            f"more than {args['max_condition_run']} items of the same condition in"
+            " a row"
+        )
+    return problems
+
+
+def condition_counts(design: Design, participants: range) -> np.ndarray:
+    """
+    How often every item is shown in every condition (items x conditions).
+    """
+    k = len(design.conditions)
+    offsets = np.arange(len(design.items))[:, None] + np.asarray(participants)[None, :]
+    counts = np.zeros((len(design.items), k), dtype=int)
+    for row, assigned in enumerate(offsets % k):
+        counts[row] = np.bincount(assigned, minlength=k)
+    return counts
+
+
+def write_list(trials: List[Trial], filename: str):
+    with open(filename, "w", encoding="utf8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(LIST_COLUMNS)
+        for trialnr, trial in enumerate(trials):
+            writer.writerow([trialnr, trial.item, trial.condition, trial.stimulus])
+
+
+def design_hash(data_folder: str) -> str:
+    digest = hashlib.sha1()
+    for name in ("stimuli.tsv", "filler.tsv"):
+        with open(os.path.join(data_folder, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def read_index(output: str) -> dict:
+    try:
+        with open(os.path.join(output, "index.json"), encoding="utf8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """
+    Union of participant id ranges [start, stop).
+    """
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Generate and validate counterbalanced, seeded trial lists for a cohort of"
+            " participants."
+        )
+    )
+    parser.add_argument(
+        "--participants", type=int, required=True, help="Number of participants."
+    )
+    parser.add_argument(
+        "--first", type=int, default=0, help="Id of the first participant."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the trial orders.")
+    parser.add_argument(
+        "--leading-fillers",
+        type=int,
+        default=1,
+        help="Number of fillers at the start of every list.",
+    )
+    parser.add_argument(
+        "--max-run",
+        type=int,
+        default=2,
+        help="Maximum number of experimental items in a row.",
+    )
+    parser.add_argument(
+        "--max-condition-run",
+        type=int,
+        default=1,
+        help="Maximum number of items of the same condition in a row.",
+    )
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=1000,
+        help="Orders to try per participant before giving up.",
+    )
+    parser.add_argument(
+        "--data", default="./data/", help="Folder with stimuli.tsv and filler.tsv."
+    )
+    parser.add_argument(
+        "--output", help="Folder for the lists (default: lists/ in the data folder)."
+    )
+
+    args = parser.parse_args()
+    if args.max_run < 1 or args.max_condition_run < 1:
+        parser.error("--max-run and --max-condition-run must be at least 1")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+    output = args["output"] or os.path.join(args["data"], "lists")
+    os.makedirs(output, exist_ok=True)
+
+    design = read_design(args["data"])
+    participants = range(args["first"], args["first"] + args["participants"])
+    parameters = {
+        "version": LIST_VERSION,
+        "design": design_hash(args["data"]),
+        "seed": args["seed"],
+        "conditions": design.conditions,
+        "leading_fillers": args["leading_fillers"],
+        "max_run": args["max_run"],
+        "max_condition_run": args["max_condition_run"],
+    }
+    # Lists can be added in batches, but only with the same design and parameters
+    index = read_index(output)
+    ranges = index.pop("participants", [])
+    if index and index != parameters:
+        sys.exit(
+            f"the lists in {output} were made from other stimuli or parameters, use"
+            " another --output"
+        )
+    for participant_id in participants:
+        try:
+            trials = participant_list(design, participant_id, args)
+        except ValueError as e:
+            sys.exit(str(e))
+        problems = validate_list(design, participant_id, trials, args)
+        if problems:
+            sys.exit(f"participant {participant_id}: {', '.join(problems)}")
+        write_list(trials, list_filename(participant_id, output))
+
+    counts = condition_counts(design, participants)
+    index_file = os.path.join(output, "index.json")
+    with open(index_file, "w", encoding="utf8") as f:
+        covered = merge_ranges(ranges + [[participants.start, participants.stop]])
+        json.dump({**parameters, "participants": covered}, f, indent=1)
+    print(
+        f"{len(participants)} lists of {len(design.items)} items in"
+        f" {len(design.conditions)} conditions and {len(design.fillers)} fillers"
+        f" written to {output}; every item is shown {counts.min()} to {counts.max()}"
+        " times per condition",
+        file=sys.stderr,
+    )
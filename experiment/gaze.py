@@ -0,0 +1,59 @@
+"""
+Online fixation detection on the gaze samples of a PyGaze eye tracker.
+
+Uses the push-based detectors from preprocessing/online.py, so that the
+trial loop can check for fixations without blocking, unlike
+tracker.wait_for_fixation_start(). The samples are taken on the thread of
+the trial loop: in dummy mode, tracker.sample() reads the PsychoPy mouse,
+which shares the window's (pyglet) event queue with event.getKeys(), and
+pyglet is not thread-safe.
+"""
+
+import os
+import sys
+from typing import Callable, List, Optional
+
+import constants
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing")
+)
+from online import (  # noqa: E402
+    DispersionDetector,
+    FixationEvent,
+    OnlineFixationDetector,
+)
+
+
+class GazeFixations:
+    def __init__(self, tracker, clock: Optional[Callable[[], float]] = None):
+        """
+        clock returns the time of a sample in ms (default: libtime.get_time,
+        replay.py passes the replayed time).
+        """
+        self.tracker = tracker
+        if clock is None:
+            # Only imported here, so that replay.py runs without PyGaze
+            from pygaze import libtime
+
+            clock = libtime.get_time
+        self.clock = clock
+        self.detector = OnlineFixationDetector(
+            DispersionDetector(
+                constants.FIXDISPERSION, constants.FIXDURATION, restart=True, timed=True
+            ),
+        )
+
+    def update(self) -> List[FixationEvent]:
+        """
+        Take one gaze sample and return the fixation events it causes.
+        Never blocks.
+        """
+        x, y = self.tracker.sample()
+        # PyGaze reports (-1, -1) when there is no valid sample
+        if (x, y) == (-1, -1):
+            return []
+        return self.detector.push((self.clock(), x, y))
+
+    def finish(self) -> List[FixationEvent]:
+        return self.detector.finish()
@@ -0,0 +1,82 @@
+"""
+Glyph vertices of the text stimuli, stored in a JSON file by layout.py, and
+the areas of interest of a trial computed from them.
+
+Only NumPy is needed, so once the vertices are stored, replay.py (and
+offline analyses) can use the layout of the stimuli without PsychoPy,
+PyGaze or a display.
+"""
+
+import json
+from typing import Iterable, List, Optional, Tuple
+
+import constants
+import numpy as np
+
+from aois import RectangleAOI, TextAOIs
+
+
+FONT = "Roboto Mono"
+LETTER_HEIGHT = 24
+# position of the left edge of the text, relative to the screen center
+TEXT_POS = (
+    -constants.DISPSIZE[0] / 2 + constants.STIMULUS_START[0],
+    -constants.DISPSIZE[1] / 2 + constants.STIMULUS_START[1],
+)
+
+
+class StoredLayouts:
+    def __init__(self, filename: str):
+        self.filename = filename
+        try:
+            with open(filename, encoding="utf8") as f:
+                self.vertices = json.load(f)
+        except FileNotFoundError:
+            self.vertices = {}
+        self.changed = False
+
+    def key(self, text: str) -> str:
+        return f"{FONT}|{LETTER_HEIGHT}|{TEXT_POS[0]},{TEXT_POS[1]}|{text}"
+
+    def missing(self, texts: Iterable[str]) -> List[str]:
+        """
+        The texts whose glyph vertices are not stored, sorted.
+        """
+        return sorted({text for text in texts if self.key(text) not in self.vertices})
+
+    def glyph_vertices(self, text: str) -> np.ndarray:
+        """
+        Pixel coordinates (relative to the screen center) of the four
+        corners of every character of text. Raises KeyError if they are not
+        stored.
+        """
+        return np.array(self.vertices[self.key(text)])
+
+    def save(self):
+        if self.changed:
+            with open(self.filename, "w", encoding="utf8") as f:
+                json.dump(self.vertices, f)
+            self.changed = False
+
+
+def trial_aois(
+    stimulus, layouts: StoredLayouts
+) -> Tuple[Optional[RectangleAOI], TextAOIs]:
+    """
+    Area of interest of a trial (None if the stimulus has no characters of
+    interest) and the character and word areas of interest of its text.
+    """
+    vertices = layouts.glyph_vertices(stimulus.text)
+    if stimulus.chars_of_interest is not None:
+        coi_start = stimulus.chars_of_interest[0]
+        coi_end = stimulus.chars_of_interest[1]
+        aoi_top_left = vertices[coi_start * 4 + 1] + (-7, -15)
+        aoi_bottom_right = vertices[coi_end * 4 - 1] + (7, 15)
+        aoi_width = aoi_bottom_right[0] - aoi_top_left[0]
+        aoi_height = aoi_bottom_right[1] - aoi_top_left[1]
+
+        disp_center = np.array(constants.DISPSIZE) / 2
+        aoi = RectangleAOI(tuple(aoi_top_left + disp_center), (aoi_width, aoi_height))
+    else:
+        aoi = None
+    return aoi, TextAOIs(stimulus.text, vertices)
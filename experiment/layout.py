@@ -0,0 +1,88 @@
+"""
+Stimulus layout, computed for all trials before the session starts.
+
+Text stimuli are created once per text, font and size, and their glyph
+vertices are stored in a JSON file (see glyphs.py) so that later sessions,
+replay.py and offline analyses can reuse the geometry. prepare_trial()
+builds the complete stimulus screen and areas of interest of a trial, so
+that showing the stimulus later is a single flip.
+"""
+
+from typing import Optional, Tuple
+
+import constants
+import numpy as np
+import pygaze
+from pygaze import libscreen
+from psychopy.visual.rect import Rect
+from psychopy.visual.textbox2 import TextBox2
+
+from aois import RectangleAOI, TextAOIs
+from glyphs import FONT, LETTER_HEIGHT, TEXT_POS, StoredLayouts, trial_aois
+
+
+class StimulusLayouts(StoredLayouts):
+    """
+    The stored glyph vertices (see glyphs.py), completed by laying out the
+    texts that are missing with TextBox2.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.textboxes = {}
+
+    def textbox(self, text: str) -> TextBox2:
+        key = self.key(text)
+        if key not in self.textboxes:
+            self.textboxes[key] = TextBox2(
+                pygaze.expdisplay,
+                text=text,
+                font=FONT,
+                letterHeight=LETTER_HEIGHT,
+                color="black",
+                size=(None, None),
+                pos=TEXT_POS,
+                anchor="left",
+            )
+        return self.textboxes[key]
+
+    def glyph_vertices(self, text: str) -> np.ndarray:
+        key = self.key(text)
+        if key not in self.vertices:
+            self.vertices[key] = np.array(self.textbox(text).verticesPix).tolist()
+            self.changed = True
+        return super().glyph_vertices(text)
+
+
+def prepare_trial(
+    stimulus, layouts: StimulusLayouts
+) -> Tuple[libscreen.Screen, Optional[RectangleAOI], TextAOIs]:
+    """
+    Build the stimulus screen of a trial, its area of interest (None if the
+    stimulus has no characters of interest) and the character and word
+    areas of interest of its text.
+    """
+    stimulus_screen = libscreen.Screen()
+    textbox = layouts.textbox(stimulus.text)
+    aoi, text_aois = trial_aois(stimulus, layouts)
+
+    # visualize area of interest (only in Dummy (debug) mode)
+    if aoi is not None and constants.DUMMYMODE:
+        disp_center = np.array(constants.DISPSIZE) / 2
+        aoi_rect = Rect(
+            pygaze.expdisplay,
+            width=aoi.size[0],
+            height=aoi.size[1],
+            pos=np.array(aoi.pos) - disp_center + np.array(aoi.size) / 2,
+            fillColor="red",
+        )
+        stimulus_screen.screen.append(aoi_rect)
+
+    stimulus_screen.screen.append(textbox)
+    # draw "irrelevant" fixation point
+    stimulus_screen.draw_fixation(
+        fixtype="dot",
+        pos=(constants.DISPSIZE[0] - 100, constants.DISPSIZE[1] - 100),
+        pw=3,
+    )
+    return stimulus_screen, aoi, text_aois
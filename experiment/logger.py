@@ -0,0 +1,146 @@
+"""
+Participant log that doesn't hold up the trial loop.
+
+Records are queued and written in batches by a background thread. Each
+stimulus text is stored once per trial in a separate lookup file instead of
+on every row, and fixation positions are stored as numeric columns. Besides
+the tab-separated text files, the log can be written as a compressed NumPy
+archive (.npz) with one typed array per column.
+"""
+
+import queue
+import threading
+from datetime import datetime
+from typing import Iterable, Tuple
+
+import numpy as np
+
+
+FIXATION_COLUMNS = [
+    "time",
+    "trialnr",
+    "fixation_start",
+    "fixation_x",
+    "fixation_y",
+    "within_aoi",
+    "word",
+]
+STIMULUS_COLUMNS = ["trialnr", "stimulus"]
+
+
+class ParticipantLog:
+    def __init__(
+        self, filename: str, formats: Iterable[str] = ("tsv",), batch_size: int = 256
+    ):
+        """
+        filename is the path without extension. Depending on formats, this
+        writes filename.txt (fixations) and filename_stimuli.txt (stimulus
+        per trial), and/or filename.npz.
+        """
+        self.filename = filename
+        self.formats = set(formats)
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+
+        if "tsv" in self.formats:
+            self.fixation_file = open(f"{filename}.txt", "w", encoding="utf8")
+            self.stimulus_file = open(f"{filename}_stimuli.txt", "w", encoding="utf8")
+            self.fixation_file.write("\t".join(FIXATION_COLUMNS) + "\n")
+            self.stimulus_file.write("\t".join(STIMULUS_COLUMNS) + "\n")
+        # columns for the .npz output
+        self.fixations = {column: [] for column in FIXATION_COLUMNS}
+        self.stimuli = {column: [] for column in STIMULUS_COLUMNS}
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start_trial(self, trialnr: int, stimulus: str):
+        self.queue.put(("trial", trialnr, stimulus))
+
+    def fixation(
+        self,
+        trialnr: int,
+        fixation_start: float,
+        pos: Tuple[float, float],
+        within_aoi: bool,
+        word: int = -1,
+    ):
+        """
+        word is the index of the fixated word in the stimulus (-1 if none).
+        """
+        self.queue.put(
+            (
+                "fixation",
+                datetime.now(),
+                trialnr,
+                fixation_start,
+                pos[0],
+                pos[1],
+                within_aoi,
+                word,
+            )
+        )
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                self.write(batch[: batch.index(None)])
+                break
+            self.write(batch)
+
+    def write(self, batch: list):
+        fixation_lines = []
+        stimulus_lines = []
+        for record in batch:
+            if record[0] == "trial":
+                _, trialnr, stimulus = record
+                if "npz" in self.formats:
+                    self.stimuli["trialnr"].append(trialnr)
+                    self.stimuli["stimulus"].append(stimulus)
+                stimulus_lines.append(f"{trialnr}\t{stimulus}\n")
+            else:
+                _, time, trialnr, fixation_start, x, y, within_aoi, word = record
+                if "npz" in self.formats:
+                    for column, value in zip(FIXATION_COLUMNS, record[1:]):
+                        self.fixations[column].append(value)
+                fixation_lines.append(
+                    f"{time.isoformat()}\t{trialnr}\t{fixation_start}\t{x}\t{y}"
+                    f"\t{within_aoi}\t{word}\n"
+                )
+
+        if "tsv" in self.formats:
+            self.stimulus_file.writelines(stimulus_lines)
+            self.fixation_file.writelines(fixation_lines)
+            self.stimulus_file.flush()
+            self.fixation_file.flush()
+
+    def close(self):
+        """
+        Write the remaining records and close the log files.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if "tsv" in self.formats:
+            self.fixation_file.close()
+            self.stimulus_file.close()
+        if "npz" in self.formats:
+            np.savez_compressed(
+                f"{self.filename}.npz",
+                time=np.array(self.fixations["time"], dtype="datetime64[us]"),
+                trialnr=np.array(self.fixations["trialnr"], dtype=np.int32),
+                fixation_start=np.array(
+                    self.fixations["fixation_start"], dtype=np.float64
+                ),
+                fixation_x=np.array(self.fixations["fixation_x"], dtype=np.float32),
+                fixation_y=np.array(self.fixations["fixation_y"], dtype=np.float32),
+                within_aoi=np.array(self.fixations["within_aoi"], dtype=bool),
+                word=np.array(self.fixations["word"], dtype=np.int32),
+                stimulus_trialnr=np.array(self.stimuli["trialnr"], dtype=np.int32),
+                stimulus=np.array(self.stimuli["stimulus"], dtype=str),
+            )
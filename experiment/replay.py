@@ -0,0 +1,336 @@
+#! /usr/bin/python3
+
+"""
+Replay recorded gaze through the trial loop of experiment.py, without a
+display and faster than real time.
+
+Use like this:
+python3 replay.py {recording.csv} --participants 1000 --output results/replay
+
+The recording is a CSV in the format preprocessing/fixations.py reads (time,
+trialId, x_left, y_left, x_right, y_right). ReplayTracker stands in for the
+PyGaze EyeTracker: it returns the recorded samples from sample(), detects
+fixations for wait_for_fixation_start() and collects log() messages, all on
+a replayed clock instead of the wall clock. Every simulated participant gets
+the stimuli of experiment.py (their list from counterbalance.py, or the
+latin square row shuffled with a seed) and a randomly chosen recorded trial
+per stimulus; the fixations are logged with the same code as
+in experiment.py (trial.py, gaze.GazeFixations, the areas of interest of
+glyphs.py), so the logs can be compared across versions and read with
+preprocessing/logs.py.
+
+Sampling and logging run in the same thread here, one iteration per sample,
+and the time of every iteration is measured. The glyph vertices of all
+stimuli of the replayed participants have to be in data/layouts.json
+already (experiment.py stores them when it lays out the stimuli), so that
+neither PsychoPy nor PyGaze is needed.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import constants
+from gaze import GazeFixations
+from glyphs import StoredLayouts, trial_aois
+from logger import ParticipantLog
+from stimuli import Stimulus, load_participant_list, load_stimuli
+from trial import end_trial, log_fixations, start_trial
+
+# preprocessing/ is on the path through gaze.py
+from fixations import read_binocular_arrays
+
+# (times in ms, xs, ys) of a recorded trial, NaN where the sample is missing
+Recording = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ReplayTracker:
+    """
+    Stand-in for pygaze.eyetracker.EyeTracker that replays recorded trials.
+    Time only moves on with advance() (or while waiting for a fixation), so
+    a trial takes as long as the code runs, not as long as it was recorded.
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self.messages: List[Tuple[float, str]] = []
+        self.status = ""
+        self.next_recording: Optional[Recording] = None
+        self.recording: Optional[Recording] = None
+        self.start_time = 0.0
+
+    def get_time(self) -> float:
+        return self.time
+
+    def advance(self, ms: float):
+        self.time += ms
+
+    def play(self, recording: Recording):
+        """
+        Replay recording from the next start_recording() on.
+        """
+        self.next_recording = recording
+
+    def calibrate(self):
+        pass
+
+    def drift_correction(self, pos=None, fix_triggered=False) -> bool:
+        return True
+
+    def start_recording(self):
+        self.recording = self.next_recording
+        self.start_time = self.time
+
+    def stop_recording(self):
+        self.recording = None
+
+    def status_msg(self, msg: str):
+        self.status = msg
+
+    def log(self, msg: str):
+        self.messages.append((self.time, msg))
+
+    def finished(self) -> bool:
+        """
+        True once the recorded trial has been replayed completely (where the
+        participant pressed [SPACE]).
+        """
+        if self.recording is None:
+            return True
+        times = self.recording[0]
+        return len(times) == 0 or self.time - self.start_time > times[-1] - times[0]
+
+    def sample(self) -> Tuple[float, float]:
+        """
+        Latest recorded gaze position at the current time, (-1, -1) if it is
+        missing (like PyGaze).
+        """
+        if self.recording is None:
+            return (-1, -1)
+        times, xs, ys = self.recording
+        if len(times) == 0:
+            return (-1, -1)
+        recording_time = times[0] + self.time - self.start_time
+        i = int(np.searchsorted(times, recording_time, side="right")) - 1
+        if i < 0 or np.isnan(xs[i]) or np.isnan(ys[i]):
+            return (-1, -1)
+        return (float(xs[i]), float(ys[i]))
+
+    def wait_for_fixation_start(self) -> Optional[Tuple[float, Tuple[float, float]]]:
+        """
+        Like PyGaze: replay samples until a fixation starts and return its
+        start time and position. Returns None if the recorded trial ends
+        first.
+        """
+        fixations = GazeFixations(self, clock=self.get_time)
+        while not self.finished():
+            for fixation in fixations.update():
+                if fixation.type == "start":
+                    return fixation.start_time, (fixation.x, fixation.y)
+            self.advance(1000 / constants.GAZESAMPLERATE)
+        return None
+
+    def close(self):
+        pass
+
+    def write_messages(self, filename: str):
+        """
+        Write the log() messages like a tracker log, readable by
+        preprocessing/logs.py.
+        """
+        with open(filename, "w", encoding="utf8") as file:
+            for message_time, msg in self.messages:
+                file.write(f"MSG\t{message_time:.1f}\t{msg}\n")
+
+
+def read_recordings(filename: str, eye: str) -> List[Recording]:
+    first = 0 if eye == "left" else 2
+    with open(filename, encoding="utf8", newline="") as file:
+        return [
+            (times, coordinates[first], coordinates[first + 1])
+            for _, times, *coordinates in read_binocular_arrays(file, keep_missing=True)
+        ]
+
+
+def replay_trial(
+    tracker: ReplayTracker,
+    log,
+    trialnr: int,
+    stimulus,
+    aoi,
+    text_aois,
+    latencies: List[float],
+) -> int:
+    """
+    Run one trial like experiment.py does and return the number of logged
+    fixations. The time of every loop iteration is added to latencies.
+    """
+    tracker.drift_correction(pos=constants.STIMULUS_START)
+    start_trial(tracker, log, trialnr, stimulus, aoi)
+    fixations = GazeFixations(tracker, clock=tracker.get_time)
+    logged = 0
+    step = 1000 / constants.GAZESAMPLERATE
+    while not tracker.finished():
+        start = time.perf_counter()
+        logged += log_fixations(log, trialnr, fixations.update(), aoi, text_aois)
+        latencies.append(time.perf_counter() - start)
+        tracker.advance(step)
+    logged += log_fixations(log, trialnr, fixations.finish(), aoi, text_aois)
+    end_trial(tracker, trialnr)
+    return logged
+
+
+def session_stimuli(
+    participant_id: int, data_folder: str, rng: random.Random
+) -> List[Stimulus]:
+    """
+    The stimuli of the participant in the order of the session, chosen like
+    experiment.py does: their list from counterbalance.py, or else their
+    row of the latin square, shuffled with rng.
+    """
+    stimuli = load_participant_list(participant_id, os.path.join(data_folder, "lists"))
+    if stimuli is None:
+        stimuli = load_stimuli(participant_id, data_folder)
+        rng.shuffle(stimuli)
+    return stimuli
+
+
+def replay_participant(
+    participant_id: int,
+    stimuli: List[Stimulus],
+    rng: random.Random,
+    recordings: List[Recording],
+    layouts: StoredLayouts,
+    args: dict,
+    latencies: List[float],
+) -> Tuple[int, int, float]:
+    """
+    Replay a session of the participant with recorded trials chosen with
+    rng. Returns the number of trials and logged fixations and the replayed
+    time in ms.
+    """
+    filename = os.path.join(args["output"], "participant_{:04d}".format(participant_id))
+    log = ParticipantLog(filename, args["formats"])
+    tracker = ReplayTracker()
+    tracker.calibrate()
+    logged = 0
+    for trialnr, stimulus in enumerate(stimuli):
+        aoi, text_aois = trial_aois(stimulus, layouts)
+        tracker.play(recordings[rng.randrange(len(recordings))])
+        logged += replay_trial(
+            tracker, log, trialnr, stimulus, aoi, text_aois, latencies
+        )
+    log.close()
+    tracker.write_messages(f"{filename}_tracker.txt")
+    tracker.close()
+    return len(stimuli), logged, tracker.get_time()
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replay recorded gaze through the trial loop of experiment.py, headless and"
+            " faster than real time."
+        )
+    )
+    parser.add_argument(
+        "recording",
+        help=(
+            "CSV with recorded gaze samples (time, trialId, x_left, y_left, x_right,"
+            " y_right)."
+        ),
+    )
+    parser.add_argument(
+        "--participants", type=int, default=1, help="Number of simulated participants."
+    )
+    parser.add_argument(
+        "--first", type=int, default=0, help="Id of the first simulated participant."
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Directory for the participant logs and tracker messages.",
+    )
+    parser.add_argument(
+        "--eye",
+        default="right",
+        choices=["left", "right"],
+        help="Which eye of the recording to replay.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the stimulus order and the choice of recorded trials.",
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        default=list(constants.LOGFORMATS),
+        choices=["tsv", "npz"],
+        help="Formats of the participant logs.",
+    )
+    parser.add_argument(
+        "--data",
+        default="./data/",
+        help="Folder with the stimuli, latin square and layouts.json.",
+    )
+    return vars(parser.parse_args())
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    recordings = read_recordings(args["recording"], args["eye"])
+    if not recordings:
+        sys.exit(f"{args['recording']} has no trials")
+    sessions = []
+    for participant_id in range(args["first"], args["first"] + args["participants"]):
+        rng = random.Random(args["seed"] * 1000003 + participant_id)
+        stimuli = session_stimuli(participant_id, args["data"], rng)
+        sessions.append((participant_id, stimuli, rng))
+    layouts = StoredLayouts(os.path.join(args["data"], "layouts.json"))
+    missing = layouts.missing(
+        stimulus.text for _, stimuli, _ in sessions for stimulus in stimuli
+    )
+    if missing:
+        sys.exit(
+            f"No stored layout for {len(missing)} stimuli, run experiment.py once"
+            " (e.g. in dummy mode) to lay them out."
+        )
+    os.makedirs(args["output"], exist_ok=True)
+
+    latencies = []
+    trials = fixations = 0
+    replayed = 0.0
+    start = time.perf_counter()
+    for participant_id, stimuli, rng in sessions:
+        participant_trials, participant_fixations, participant_time = (
+            replay_participant(
+                participant_id, stimuli, rng, recordings, layouts, args, latencies
+            )
+        )
+        trials += participant_trials
+        fixations += participant_fixations
+        replayed += participant_time
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1e6
+    print(
+        f"{args['participants']} participants, {trials} trials, {fixations} fixations;"
+        f" replayed {replayed / 1000:.1f} s in {elapsed:.1f} s"
+        f" ({replayed / 1000 / elapsed:.0f}x real time)",
+        file=sys.stderr,
+    )
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(
+            f"iteration latency: median {p50:.1f} us, 95% {p95:.1f} us,"
+            f" 99% {p99:.1f} us, max {latencies.max():.1f} us",
+            file=sys.stderr,
+        )
@@ -0,0 +1,90 @@
+"""
+Stimuli of a participant, chosen by the latin square in data/ or read from
+the participant's precomputed trial list (see counterbalance.py).
+
+Only the standard library is needed, so the stimulus lists can also be built
+without PsychoPy (e.g. by replay.py).
+"""
+
+import csv
+import os
+from typing import List, Optional
+
+LIST_COLUMNS = ["trialnr", "item", "condition", "stimulus"]
+
+
+class Stimulus:
+    def __init__(self, text):
+        if "|" in text:
+            text_before, text_of_interest, text_after = text.split("|")
+            self.text = text.replace("|", "")
+            self.chars_of_interest = (
+                len(text_before),
+                len(text_before) + len(text_of_interest),
+            )
+        else:
+            self.text = text
+            self.chars_of_interest = None
+
+
+def load_stimuli(participant_id: int, data_folder: str) -> List[Stimulus]:
+    """
+    Stimuli of the participant's row of the latin square, in the order of
+    the row (the experiment shuffles them).
+    """
+    # load latin square
+    with open(os.path.join(data_folder, "latin_square.tsv"), encoding="utf8") as lq:
+        item_lists = lq.readlines()
+        # right now, first participant should be number 0, if we want to start at
+        # 1, we just need to modify the next line by -1
+        participant_list = item_lists[participant_id % 4].split("\t")
+
+    # load trial items
+    trial_items = {}
+    stimuli_path = os.path.join(data_folder, "stimuli.tsv")
+    with open(stimuli_path, encoding="utf8") as stimulus_data:
+        stimulus_rows = csv.DictReader(stimulus_data, delimiter="\t")
+        for row in stimulus_rows:
+            trial_items[int(row["Item"])] = row
+
+    # load filler items
+    filler_items = {}
+    with open(os.path.join(data_folder, "filler.tsv"), encoding="utf8") as filler_data:
+        filler_rows = csv.reader(filler_data, delimiter="\t")
+        for row in filler_rows:
+            filler_items[int(row[0])] = row[1]
+
+    # fill stimuli list
+    stimuli = []
+    for item in participant_list:
+        itemNr, condition = item.split("/")
+        if itemNr == "F":  # filler
+            stimulus = filler_items[int(condition)]
+        else:
+            stimulus = trial_items[int(itemNr)]["Stimulus"].format(
+                *trial_items[int(itemNr)][condition].split(",")
+            )
+        stimuli.append(Stimulus(stimulus))
+    return stimuli
+
+
+def list_filename(participant_id: int, list_folder: str) -> str:
+    return os.path.join(list_folder, "participant_{:04d}.tsv".format(participant_id))
+
+
+def load_participant_list(
+    participant_id: int, list_folder: str
+) -> Optional[List[Stimulus]]:
+    """
+    Stimuli of the participant's precomputed trial list, in the order they
+    are shown, or None if there is no list for the participant.
+    """
+    try:
+        with open(
+            list_filename(participant_id, list_folder), encoding="utf8", newline=""
+        ) as f:
+            return [
+                Stimulus(row["stimulus"]) for row in csv.DictReader(f, delimiter="\t")
+            ]
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,44 @@
+"""
+The parts of a trial that don't depend on the display: the synchronisation
+messages to the tracker and the logging of fixation starts with their areas
+of interest. Used by experiment.py and by replay.py.
+"""
+
+from typing import Iterable
+
+
+def start_trial(tracker, log, trialnr: int, stimulus, aoi):
+    """
+    Start recording and send the start_trial message (with the area of
+    interest, if any) that preprocessing/logs.py reads.
+    """
+    tracker.start_recording()
+    tracker.status_msg(f"trial {trialnr}")
+    logmsg = f"start_trial {trialnr} stimulus '{stimulus.text}'"
+    if aoi is not None:
+        logmsg += f" aoi x={aoi.pos[0]},y={aoi.pos[1]},w={aoi.size[0]},h={aoi.size[1]}"
+    tracker.log(logmsg)
+    log.start_trial(trialnr, stimulus.text)
+
+
+def log_fixations(log, trialnr: int, fixations: Iterable, aoi, text_aois) -> int:
+    """
+    Log the start of every fixation in fixations (events of
+    online.OnlineFixationDetector) with whether it lies within the area of
+    interest and which word it hits. Returns the number of logged fixations.
+    """
+    logged = 0
+    for fixation in fixations:
+        if fixation.type != "start":
+            continue
+        startpos = (fixation.x, fixation.y)
+        within_aoi = aoi is not None and aoi.contains(startpos)
+        word = text_aois.word_at(*startpos)
+        log.fixation(trialnr, fixation.start_time, startpos, within_aoi, word)
+        logged += 1
+    return logged
+
+
+def end_trial(tracker, trialnr: int):
+    tracker.stop_recording()
+    tracker.log(f"end_trial {trialnr}")
@@ -0,0 +1,400 @@
+"""
+Fixation detection for a whole study, recomputing only what changed.
+
+The recordings (one CSV per participant, in the schema fixations.py reads)
+are given as a directory or as a manifest file. Every recording's fixations
+are stored as a part in the output directory, together with a manifest of
+the SHA-1 of the recording, a hash of the detection parameters and a hash of
+every trial's samples. On the next run:
+
+- recordings whose hash and parameters are unchanged are skipped,
+- in recordings that changed, trials whose samples are unchanged reuse their
+  stored fixations, and only the other trials are detected again,
+- changing a parameter recomputes everything.
+
+Changed recordings are processed in parallel (--jobs) and all parts are
+merged into one fixation dataset for the study: fixations.npy, a record
+array of STUDY_DTYPE sorted by participant and trial, and study.json with
+the participant names and trial ids the codes in it refer to.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import source_digest, write_json
+from fixations import FIXATION_DTYPE, detect_fixations, open_trials
+from logs import participant_name, participant_sort_key
+
+
+BATCH_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+STUDY_FILENAME = "study.json"
+PARTS_DIRECTORY = "parts"
+# Arguments that change the detected fixations
+DETECTION_PARAMETERS = ["mode", "freq", "threshold", "eye", "preprocess"]
+QUALITY_PARAMETERS = [
+    "cross",
+    "cross_duration",
+    "correct",
+    "max_gap",
+    "max_dropout",
+    "max_accuracy",
+    "max_precision",
+]
+STUDY_DTYPE = np.dtype(
+    [("participant", np.int32), ("trial", np.int32), *FIXATION_DTYPE.descr]
+)
+
+
+def recordings(source: str) -> List[Tuple[str, str]]:
+    """
+    (path, participant) of every recording: the CSV files in the directory
+    source, or the lines of the manifest file source. A manifest line is a
+    path (relative to the manifest), optionally followed by a tab and the
+    participant name; lines starting with # are ignored. Without a name, the
+    participant is the last number in the file name.
+    """
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.endswith(".csv") and os.path.isfile(os.path.join(source, name))
+        )
+        return [(path, participant_name(path)) for path in paths]
+
+    entries = []
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf8") as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            path, _, participant = line.partition("\t")
+            path = os.path.join(base, path)
+            entries.append((path, participant or participant_name(path)))
+    return entries
+
+
+def parameter_key(args: dict) -> str:
+    names = DETECTION_PARAMETERS + (QUALITY_PARAMETERS if args["preprocess"] else [])
+    parameters = {name: args[name] for name in names}
+    parameters["version"] = BATCH_VERSION
+    return hashlib.sha1(
+        json.dumps(parameters, sort_keys=True).encode("utf8")
+    ).hexdigest()
+
+
+def trial_hash(times: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> str:
+    digest = hashlib.sha1()
+    for column in (times, xs, ys):
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+def part_path(output: str, path: str) -> str:
+    name = hashlib.sha1(os.path.abspath(path).encode("utf8")).hexdigest()[:16]
+    return os.path.join(output, PARTS_DIRECTORY, f"{name}.npz")
+
+
+def load_part(path: str) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        with np.load(path) as part:
+            return {name: part[name] for name in part.files}
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+
+
+def save_part(path: str, **columns: np.ndarray):
+    # Write to a temporary file first so that a crash never leaves half a part
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **columns)
+    os.replace(temporary, path)
+
+
+def previous_trials(part: Optional[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Fixations of every trial of a stored part, by the hash of its samples.
+    """
+    if part is None:
+        return {}
+    bounds = np.concatenate(([0], np.cumsum(part["trial_counts"])))
+    return {
+        digest: part["fixations"][start:end]
+        for digest, start, end in zip(
+            part["trial_hashes"].tolist(), bounds[:-1], bounds[1:]
+        )
+    }
+
+
+def process_recording(path: str, part: str, reusable: bool, args: dict) -> dict:
+    """
+    Detect the fixations of one recording and store them in part. If
+    reusable (the parameters didn't change), trials with the same samples as
+    in the stored part keep their fixations. Runs in a worker process.
+    """
+    previous = previous_trials(load_part(part)) if reusable else {}
+    trial_ids, trial_hashes, counts, fixations = [], [], [], []
+    reused = 0
+    for tid, times, xs, ys in open_trials({**args, "input": path, "cache": None}):
+        digest = trial_hash(times, xs, ys)
+        trial_fixations = previous.get(digest)
+        if trial_fixations is None:
+            trial_fixations = detect_fixations(times, xs, ys, args)
+        else:
+            reused += 1
+        trial_ids.append(tid)
+        trial_hashes.append(digest)
+        counts.append(len(trial_fixations))
+        fixations.append(trial_fixations)
+
+    save_part(
+        part,
+        fixations=(
+            np.concatenate(fixations) if fixations else np.empty(0, FIXATION_DTYPE)
+        ),
+        trial_ids=np.array(trial_ids, dtype=str),
+        trial_hashes=np.array(trial_hashes, dtype=str),
+        trial_counts=np.array(counts, dtype=np.int64),
+    )
+    return {"trials": len(trial_ids), "reused": reused, "fixations": int(sum(counts))}
+
+
+def read_manifest(output: str) -> dict:
+    try:
+        with open(os.path.join(output, MANIFEST_FILENAME), encoding="utf8") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"files": {}}
+    return manifest if manifest.get("version") == BATCH_VERSION else {"files": {}}
+
+
+def update(source: str, output: str, args: dict, jobs: int = 1) -> Tuple[dict, bool]:
+    """
+    Bring the parts in output up to date with the recordings in source.
+    Returns the new manifest and whether anything changed.
+    """
+    os.makedirs(os.path.join(output, PARTS_DIRECTORY), exist_ok=True)
+    manifest = read_manifest(output)
+    key = parameter_key(args)
+    files = {}
+    pending = []
+    for path, participant in recordings(source):
+        entry = manifest["files"].get(os.path.abspath(path))
+        # Reuses the hash index of cache.py, so unchanged files aren't rehashed
+        digest = source_digest(path, output)
+        part = part_path(output, path)
+        current = {
+            "participant": participant,
+            "sha1": digest,
+            "parameters": key,
+            "part": os.path.relpath(part, output),
+        }
+        if (
+            entry is not None
+            and all(entry.get(name) == value for name, value in current.items())
+            and os.path.exists(part)
+        ):
+            files[os.path.abspath(path)] = entry
+        else:
+            reusable = entry is not None and entry.get("parameters") == key
+            pending.append((path, part, reusable, current))
+
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = [
+                executor.submit(process_recording, path, part, reusable, args)
+                for path, part, reusable, _ in pending
+            ]
+            results = [future.result() for future in futures]
+    else:
+        results = [
+            process_recording(path, part, reusable, args)
+            for path, part, reusable, _ in pending
+        ]
+
+    for (path, _, _, current), result in zip(pending, results):
+        files[os.path.abspath(path)] = {**current, **result}
+        print(
+            f"{path}: {result['trials']} trials ({result['reused']} reused),"
+            f" {result['fixations']} fixations",
+            file=sys.stderr,
+        )
+
+    # Parts of recordings that are gone
+    kept = {entry["part"] for entry in files.values()}
+    for entry in manifest["files"].values():
+        if entry["part"] not in kept and os.path.exists(
+            os.path.join(output, entry["part"])
+        ):
+            os.remove(os.path.join(output, entry["part"]))
+
+    changed = bool(pending) or set(files) != set(manifest["files"])
+    manifest = {"version": BATCH_VERSION, "parameters": key, "files": files}
+    write_json(os.path.join(output, MANIFEST_FILENAME), manifest)
+    return manifest, changed
+
+
+def merge_parts(manifest: dict, output: str):
+    """
+    Concatenate all parts into the study dataset (fixations.npy and
+    study.json) in output.
+    """
+    entries = sorted(
+        manifest["files"].values(),
+        key=lambda entry: (participant_sort_key(entry["participant"]), entry["part"]),
+    )
+    # Participant codes in order of appearance
+    codes: Dict[str, int] = {}
+    trials = []
+    merged = []
+    for entry in entries:
+        part = load_part(os.path.join(output, entry["part"]))
+        code = codes.setdefault(entry["participant"], len(codes))
+        records = np.empty(len(part["fixations"]), STUDY_DTYPE)
+        for name in FIXATION_DTYPE.names:
+            records[name] = part["fixations"][name]
+        records["participant"] = code
+        records["trial"] = np.repeat(
+            np.arange(len(trials), len(trials) + len(part["trial_ids"])),
+            part["trial_counts"],
+        )
+        trials.extend([code, tid] for tid in part["trial_ids"].tolist())
+        merged.append(records)
+
+    fixations = np.concatenate(merged) if merged else np.empty(0, STUDY_DTYPE)
+    temporary = os.path.join(output, f"fixations.{os.getpid()}.tmp.npy")
+    np.save(temporary, fixations)
+    os.replace(temporary, os.path.join(output, "fixations.npy"))
+    write_json(
+        os.path.join(output, STUDY_FILENAME),
+        {"participants": list(codes), "trials": trials, "fixations": len(fixations)},
+    )
+
+
+class StudyDataset:
+    """
+    Memory-mapped view of the study dataset written by merge_parts().
+    """
+
+    def __init__(self, output: str):
+        with open(os.path.join(output, STUDY_FILENAME), encoding="utf8") as file:
+            study = json.load(file)
+        self.participants: List[str] = study["participants"]
+        self.trials: List[Tuple[int, str]] = [tuple(trial) for trial in study["trials"]]
+        self.fixations = np.load(os.path.join(output, "fixations.npy"), mmap_mode="r")
+        self.codes = {name: code for code, name in enumerate(self.participants)}
+        self.rows = {trial: row for row, trial in enumerate(self.trials)}
+
+    def trial_fixations(self, participant: str, trial_id: str) -> np.ndarray:
+        trial = self.rows[self.codes[str(participant)], str(trial_id)]
+        start, end = np.searchsorted(self.fixations["trial"], [trial, trial + 1])
+        return self.fixations[start:end]
+
+    def write_csv(self, file):
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(["participant", "trialId", "start_time", "end_time", "x", "y"])
+        for participant, trial, *fixation in self.fixations.tolist():
+            writer.writerow(
+                [self.participants[participant], self.trials[trial][1], *fixation]
+            )
+
+
+def open_study(source: str, output: str, args: dict, jobs: int = 1) -> StudyDataset:
+    """
+    Study dataset of the recordings in source, stored in output and updated
+    for the recordings and parameters that changed since the last run.
+    """
+    manifest, changed = update(source, output, args, jobs)
+    if changed or not os.path.exists(os.path.join(output, STUDY_FILENAME)):
+        merge_parts(manifest, output)
+    return StudyDataset(output)
+
+
+def read_parameters():
+    import detectors
+    import quality
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Detect the fixations of all recordings of a study and merge them into one"
+            " dataset, recomputing only recordings and trials that changed."
+        )
+    )
+    parser.add_argument(
+        "source",
+        help=(
+            "Directory with one CSV per participant, or a manifest file listing them"
+            " (path, optionally a tab and the participant name)."
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help=(
+            "Directory for the study dataset, the manifest and the per-recording parts."
+        ),
+    )
+    parser.add_argument(
+        "--mode",
+        default="dispersion",
+        choices=list(detectors.DETECTORS),
+        help="Algorithm used for detection (see fixations.py --help).",
+    )
+    parser.add_argument(
+        "--freq", type=int, required=True, help="Sampling frequency of the recordings."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help=(
+            "Dispersion threshold for dispersion-based mode. Maximum velocity threshold"
+            " for velocity-based mode."
+        ),
+    )
+    parser.add_argument(
+        "--eye", default="right", choices=["left", "right"], help="Which eye to use."
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes."
+    )
+    parser.add_argument(
+        "--csv",
+        help=(
+            "Also write all fixations (participant, trialId, start_time, end_time, x,"
+            " y) as CSV to this file."
+        ),
+    )
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="Run the quality stage of quality.py before detection.",
+    )
+    quality.add_arguments(parser.add_argument_group("quality stage"))
+
+    args = parser.parse_args()
+    if args.threshold is None and detectors.DETECTORS[args.mode].needs_threshold:
+        parser.error(f"--mode {args.mode} needs a --threshold")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    study = open_study(args["source"], args["output"], args, args["jobs"])
+    print(
+        f"{len(study.participants)} participants, {len(study.trials)} trials,"
+        f" {len(study.fixations)} fixations",
+        file=sys.stderr,
+    )
+    if args["csv"]:
+        with open(args["csv"], "w", encoding="utf8", newline="") as file:
+            study.write_csv(file)
@@ -0,0 +1,429 @@
+import argparse
+import io
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterator, List, Tuple
+
+import numpy as np
+
+from fixations import (
+    Fixation,
+    data_points,
+    dispersion_based_fixations,
+    dispersion_based_fixations_array,
+    fixation_list,
+    incremental_dispersion_based_fixations,
+    read_trial_arrays,
+    read_trials,
+    sample_records,
+    velocity_based_fixations,
+    velocity_based_fixations_array,
+)
+from detectors import DETECTORS
+from synthetic import (
+    GazeParameters,
+    dropout_mask,
+    synthetic_csv,
+    synthetic_gaze,
+    synthetic_trial,
+)
+
+
+def timed(function: Callable, *args) -> Tuple[list, float]:
+    start = time.perf_counter()
+    result = list(function(*args))
+    return result, time.perf_counter() - start
+
+
+def assert_same_fixations(reference: List[Fixation], other: List[Fixation]):
+    assert len(reference) == len(other), "different number of fixations"
+    for (s1, e1, x1, y1), (s2, e2, x2, y2) in zip(reference, other):
+        assert (s1, e1) == (s2, e2), "different fixation boundaries"
+        assert abs(x1 - x2) < 1e-6 and abs(y1 - y2) < 1e-6, "different centroids"
+
+
+def compare_dispersion(freq: int, seconds: float, threshold: float):
+    trial = synthetic_trial(freq, seconds)
+    duration_threshold = 0.2 / freq
+    reference, reference_time = timed(
+        dispersion_based_fixations, trial, threshold, duration_threshold
+    )
+    incremental, incremental_time = timed(
+        incremental_dispersion_based_fixations, trial, threshold, duration_threshold
+    )
+    samples = sample_records(*(np.array(column) for column in zip(*trial)))
+    start = time.perf_counter()
+    records = dispersion_based_fixations_array(
+        samples["time"], samples["x"], samples["y"], threshold, duration_threshold
+    )
+    array_time = time.perf_counter() - start
+
+    assert_same_fixations(reference, incremental)
+    assert records.tolist() == incremental, "array version differs from incremental"
+
+    print(
+        f"dispersion {freq:>5} Hz {len(trial):>8} samples {len(reference):>6} fixations"
+        f" | reference {reference_time:8.3f}s"
+        f" | incremental {incremental_time:8.3f}s"
+        f" | array {array_time:8.3f}s"
+        f" | speedup {reference_time / array_time:6.1f}x"
+    )
+
+
+def compare_memory(freq: int, seconds: float):
+    """
+    Memory per sample of a trial held as a list of data points and as a
+    SAMPLE_DTYPE record array.
+    """
+    times, xs, ys = synthetic_gaze(GazeParameters(freq=freq), seconds)
+    tracemalloc.start()
+    try:
+        points = data_points(times, xs, ys)
+        list_bytes = tracemalloc.get_traced_memory()[0]
+        del points
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        samples = sample_records(times, xs, ys)
+        record_bytes = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    print(
+        f"memory     {freq:>5} Hz {len(samples):>8} samples"
+        f" | data points {list_bytes / len(samples):6.1f} bytes/sample"
+        f" | records {record_bytes / len(samples):6.1f} bytes/sample"
+    )
+
+
+def compare_velocity(freq: int, seconds: float, threshold: float):
+    trial = synthetic_trial(freq, seconds)
+    times, xs, ys = (np.array(column) for column in zip(*trial))
+    reference, reference_time = timed(
+        velocity_based_fixations, trial, threshold, 1000 / freq
+    )
+    start = time.perf_counter()
+    vectorized = velocity_based_fixations_array(times, xs, ys, threshold, 1000 / freq)
+    vectorized_time = time.perf_counter() - start
+
+    assert_same_fixations(reference, fixation_list(vectorized))
+
+    print(
+        f"velocity   {freq:>5} Hz {len(trial):>8} samples {len(reference):>6} fixations"
+        f" | reference {reference_time:8.3f}s"
+        f" | vectorized {vectorized_time:8.3f}s"
+        f" | speedup {reference_time / vectorized_time:6.1f}x"
+    )
+
+
+def compare_reader(freq: int, seconds: float, trials: int):
+    data = synthetic_csv(GazeParameters(freq=freq), seconds, trials)
+    reference, reference_time = timed(read_trials, io.StringIO(data), "right")
+    columnar, columnar_time = timed(read_trial_arrays, io.StringIO(data), "right")
+
+    assert [tid for tid, _ in reference] == [tid for tid, *_ in columnar]
+    for (_, trial), (_, times, xs, ys) in zip(reference, columnar):
+        assert trial == list(zip(times.tolist(), xs.tolist(), ys.tolist()))
+
+    samples = sum(len(trial) for _, trial in reference)
+    print(
+        f"reader     {freq:>5} Hz {samples:>8} samples {trials:>6} trials   "
+        f" | reference {reference_time:8.3f}s"
+        f" | columnar {columnar_time:8.3f}s"
+        f" | speedup {reference_time / columnar_time:6.1f}x"
+    )
+
+
+def check_velocity(runs: int, seed: int = 0):
+    """
+    Randomized equivalence check of the generator and array versions of the
+    velocity-based algorithm, including degenerate trials and zero timestamps.
+    """
+    rng = random.Random(seed)
+    for _ in range(runs):
+        n = rng.randint(0, 50)
+        times = [rng.choice([0, rng.randint(1, 10000)]) for _ in range(n)]
+        xs = [float(rng.randint(0, 20)) for _ in range(n)]
+        ys = [rng.uniform(0, 20) for _ in range(n)]
+        threshold = rng.uniform(0, 10)
+        time_diff = rng.choice([0.5, 1000 / 60, 1])
+        reference = list(
+            velocity_based_fixations(list(zip(times, xs, ys)), threshold, time_diff)
+        )
+        vectorized = velocity_based_fixations_array(
+            np.array(times, dtype=int), np.array(xs), np.array(ys), threshold, time_diff
+        )
+        assert_same_fixations(reference, fixation_list(vectorized))
+    print(f"velocity   {runs} random trials identical")
+
+
+def suite_cases(
+    parameters: GazeParameters, seconds: float, threshold: float, velocity: float
+) -> Iterator[Tuple[str, int, Callable, Callable]]:
+    """
+    Benchmarked functions on one synthetic recording: (name, number of
+    samples, function, function returning fresh arguments).
+    """
+    freq = parameters.freq
+    times, xs, ys = synthetic_gaze(parameters, seconds)
+    keep = ~dropout_mask(parameters, len(times))
+    times, xs, ys = times[keep], xs[keep], ys[keep]
+    points = list(zip(times.tolist(), xs.tolist(), ys.tolist()))
+    data = synthetic_csv(parameters, seconds, trials=1)
+    rows = data.count("\n") - 1
+
+    yield (
+        "dispersion",
+        len(points),
+        dispersion_based_fixations,
+        lambda: (points, threshold, 0.2 / freq),
+    )
+    yield (
+        "dispersion_incremental",
+        len(points),
+        incremental_dispersion_based_fixations,
+        lambda: (points, threshold, 0.2 / freq),
+    )
+    yield (
+        "dispersion_array",
+        len(points),
+        dispersion_based_fixations_array,
+        lambda: (times, xs, ys, threshold, 0.2 / freq),
+    )
+    yield (
+        "velocity",
+        len(points),
+        velocity_based_fixations,
+        lambda: (points, velocity, 1000 / freq),
+    )
+    yield (
+        "velocity_array",
+        len(points),
+        velocity_based_fixations_array,
+        lambda: (times, xs, ys, velocity, 1000 / freq),
+    )
+    for name, detector in DETECTORS.items():
+        detector_args = {
+            "mode": name,
+            "freq": freq,
+            "threshold": threshold if name == "dispersion" else velocity,
+        }
+        yield (
+            f"detect_{name}",
+            len(points),
+            detector.function,
+            lambda detector_args=detector_args: (times, xs, ys, detector_args),
+        )
+    yield "read_trials", rows, read_trials, lambda: (io.StringIO(data), "right")
+    yield (
+        "read_trial_arrays",
+        rows,
+        read_trial_arrays,
+        lambda: (io.StringIO(data), "right"),
+    )
+
+
+def measure(function: Callable, arguments: Callable, repeat: int) -> Tuple[float, int]:
+    """
+    Best time of repeat runs, and the peak memory allocated during one more
+    run (traced separately, as tracing slows the run down).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        args = arguments()
+        start = time.perf_counter()
+        list(function(*args))
+        best = min(best, time.perf_counter() - start)
+
+    args = arguments()
+    tracemalloc.start()
+    try:
+        list(function(*args))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_suite(args: dict) -> List[dict]:
+    results = []
+    for freq in args["rates"]:
+        parameters = GazeParameters(
+            freq=freq,
+            noise=args["noise"],
+            dropout=args["dropout"],
+            dropout_length=args["dropout_length"],
+        )
+        for seconds in args["sizes"]:
+            for name, samples, function, arguments in suite_cases(
+                parameters, seconds, args["threshold"], args["velocity"]
+            ):
+                if args["functions"] and name not in args["functions"]:
+                    continue
+                elapsed, peak = measure(function, arguments, args["repeat"])
+                result = {
+                    "name": name,
+                    "freq": freq,
+                    "seconds": seconds,
+                    "samples": samples,
+                    "time": elapsed,
+                    "throughput": samples / elapsed if elapsed else float("inf"),
+                    "peak_memory": peak,
+                }
+                print(
+                    f"{name:<24} {freq:>5} Hz {seconds:>6g} s {samples:>9} samples"
+                    f" | {elapsed:8.3f}s | {result['throughput']:12.0f} samples/s"
+                    f" | peak {peak / 2**20:8.2f} MiB"
+                )
+                results.append(result)
+    return results
+
+
+def regressions(
+    results: List[dict], baseline: List[dict], tolerance: float
+) -> List[str]:
+    """
+    Cases that got slower or use more memory than in the baseline, by more
+    than the tolerance (a fraction).
+    """
+    known = {(case["name"], case["freq"], case["seconds"]): case for case in baseline}
+    found = []
+    for case in results:
+        before = known.get((case["name"], case["freq"], case["seconds"]))
+        if before is None:
+            continue
+        label = f"{case['name']} {case['freq']} Hz {case['seconds']:g} s"
+        if case["throughput"] < before["throughput"] * (1 - tolerance):
+            found.append(
+                f"{label}: {case['throughput']:.0f} samples/s, was"
+                f" {before['throughput']:.0f}"
+            )
+        if case["peak_memory"] > before["peak_memory"] * (1 + tolerance):
+            found.append(
+                f"{label}: peak {case['peak_memory']} bytes, was"
+                f" {before['peak_memory']}"
+            )
+    return found
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the reference and optimized fixation detection algorithms on"
+            " synthetic data."
+        )
+    )
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=10,
+        help="Length of the synthetic recording in seconds.",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=20, help="Dispersion threshold."
+    )
+    parser.add_argument(
+        "--velocity", type=float, default=1, help="Maximum velocity threshold."
+    )
+    parser.add_argument(
+        "--check",
+        type=int,
+        default=1000,
+        help="Number of random trials for the equivalence check.",
+    )
+    parser.add_argument(
+        "--suite",
+        action="store_true",
+        help=(
+            "Instead of the comparisons, time all functions on recordings of several"
+            " rates and sizes and report throughput and peak memory."
+        ),
+    )
+    parser.add_argument(
+        "--rates",
+        type=int,
+        nargs="+",
+        default=[60, 500, 2000],
+        help="Sampling rates (Hz) of the suite.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[5, 20],
+        help="Recording lengths (seconds) of the suite.",
+    )
+    parser.add_argument(
+        "--functions",
+        nargs="+",
+        help="Only run these functions in the suite (e.g. velocity_array read_trials).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per case of the suite; the best one counts.",
+    )
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=2.0,
+        help="Standard deviation of the synthetic sensor noise in pixels.",
+    )
+    parser.add_argument(
+        "--dropout",
+        type=float,
+        default=0.02,
+        help="Fraction of missing synthetic samples.",
+    )
+    parser.add_argument(
+        "--dropout-length",
+        type=float,
+        default=0,
+        help=(
+            "Mean length of runs of missing samples in seconds (0 for single samples)."
+        ),
+    )
+    parser.add_argument("--save", help="Write the suite results to this JSON file.")
+    parser.add_argument(
+        "--baseline",
+        help=(
+            "JSON file of an earlier --save to compare against; exits with status 1 on"
+            " regressions."
+        ),
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown or memory increase against the baseline, as a fraction.",
+    )
+
+    return vars(parser.parse_args())
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+    if args["suite"]:
+        results = run_suite(args)
+        if args["save"]:
+            with open(args["save"], "w", encoding="utf8") as file:
+                json.dump(results, file, indent=1)
+        if args["baseline"]:
+            with open(args["baseline"], encoding="utf8") as file:
+                found = regressions(results, json.load(file), args["tolerance"])
+            for regression in found:
+                print(f"regression: {regression}", file=sys.stderr)
+            sys.exit(1 if found else 0)
+        sys.exit(0)
+
+    for freq in (60, 2000):
+        compare_dispersion(freq, args["seconds"], args["threshold"])
+    for freq in (60, 2000):
+        compare_velocity(freq, args["seconds"], args["velocity"])
+    for freq in (60, 2000):
+        compare_memory(freq, args["seconds"])
+    check_velocity(args["check"])
+    for freq in (60, 2000):
+        compare_reader(freq, args["seconds"], trials=10)
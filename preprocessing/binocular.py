@@ -0,0 +1,266 @@
+"""
+Binocular fixation detection in one pass over the data.
+
+Both eyes are read in the same scan, and the fixations are detected on the
+left eye, the right eye and the cyclopean gaze (the average of both eyes,
+or the one eye that was tracked where the other is missing). For every trial,
+a row with the disagreement between the eyes is written: how often only one
+eye was tracked, how far apart the eyes' gaze positions are, and how many
+fixations of one eye have no overlapping fixation of the other.
+"""
+
+import argparse
+import csv
+import sys
+from typing import Dict, Iterator
+
+import numpy as np
+
+from fixations import (
+    FIXATION_DTYPE,
+    BinocularArrays,
+    detect_fixations,
+    read_binocular_arrays,
+)
+
+
+EYES = ["left", "right", "cyclopean"]
+REPORT_COLUMNS = [
+    "trialId",
+    "samples",
+    "both_eyes",
+    "left_only",
+    "right_only",
+    "mean_offset",
+    "max_offset",
+    "disagreeing_samples",
+    "fixations_left",
+    "fixations_right",
+    "fixations_cyclopean",
+    "unmatched_left",
+    "unmatched_right",
+    "mean_centroid_distance",
+]
+
+
+def cyclopean(
+    x_left: np.ndarray, y_left: np.ndarray, x_right: np.ndarray, y_right: np.ndarray
+):
+    """
+    Average of both eyes, or the tracked eye where the other one is missing.
+    """
+    left_missing = np.isnan(x_left)
+    right_missing = np.isnan(x_right)
+    xs = np.where(
+        left_missing, x_right, np.where(right_missing, x_left, (x_left + x_right) / 2)
+    )
+    ys = np.where(
+        left_missing, y_right, np.where(right_missing, y_left, (y_left + y_right) / 2)
+    )
+    return xs, ys
+
+
+def detect_binocular(
+    times: np.ndarray,
+    x_left: np.ndarray,
+    y_left: np.ndarray,
+    x_right: np.ndarray,
+    y_right: np.ndarray,
+    args: dict,
+) -> Dict[str, np.ndarray]:
+    """
+    Fixations (FIXATION_DTYPE record arrays) of the left eye, the right eye
+    and the cyclopean gaze, each detected on the samples where it exists.
+    """
+    gaze = {
+        "left": (x_left, y_left),
+        "right": (x_right, y_right),
+        "cyclopean": cyclopean(x_left, y_left, x_right, y_right),
+    }
+    fixations = {}
+    for eye, (xs, ys) in gaze.items():
+        tracked = ~np.isnan(xs)
+        if tracked.any():
+            fixations[eye] = detect_fixations(
+                times[tracked], xs[tracked], ys[tracked], args
+            )
+        else:
+            fixations[eye] = np.empty(0, FIXATION_DTYPE)
+    return fixations
+
+
+def matching_fixations(fixations: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    For every fixation, the index of the fixation in others that starts
+    closest to it and overlaps it in time, or -1 if there is none.
+    """
+    if len(others) == 0:
+        return np.full(len(fixations), -1)
+    order = np.argsort(others["start"], kind="stable")
+    starts = others["start"][order]
+    after = np.searchsorted(starts, fixations["start"])
+    best = np.full(len(fixations), -1)
+    best_gap = np.full(len(fixations), np.inf)
+    # The closest start is either the last one before or the first one after
+    for candidates in (after - 1, after):
+        valid = (candidates >= 0) & (candidates < len(starts))
+        match = order[np.clip(candidates, 0, len(starts) - 1)]
+        overlaps = (
+            valid
+            & (others["start"][match] <= fixations["end"])
+            & (others["end"][match] >= fixations["start"])
+        )
+        gap = np.abs(others["start"][match] - fixations["start"])
+        better = overlaps & (gap < best_gap)
+        best[better] = match[better]
+        best_gap[better] = gap[better]
+    return best
+
+
+def disagreement(
+    tid: str,
+    x_left: np.ndarray,
+    y_left: np.ndarray,
+    x_right: np.ndarray,
+    y_right: np.ndarray,
+    fixations: Dict[str, np.ndarray],
+    max_offset: float,
+) -> dict:
+    left = ~np.isnan(x_left)
+    right = ~np.isnan(x_right)
+    both = left & right
+    offsets = np.hypot(x_left[both] - x_right[both], y_left[both] - y_right[both])
+
+    left_matches = matching_fixations(fixations["left"], fixations["right"])
+    right_matches = matching_fixations(fixations["right"], fixations["left"])
+    matched = left_matches >= 0
+    lefts = fixations["left"][matched]
+    rights = fixations["right"][left_matches[matched]]
+    distances = np.hypot(lefts["x"] - rights["x"], lefts["y"] - rights["y"])
+
+    n = len(left)
+    return {
+        "trialId": tid,
+        "samples": n,
+        "both_eyes": f"{np.count_nonzero(both) / n:.4f}" if n else "",
+        "left_only": int(np.count_nonzero(left & ~right)),
+        "right_only": int(np.count_nonzero(right & ~left)),
+        "mean_offset": f"{offsets.mean():.2f}" if len(offsets) else "",
+        "max_offset": f"{offsets.max():.2f}" if len(offsets) else "",
+        "disagreeing_samples": int(np.count_nonzero(offsets > max_offset)),
+        "fixations_left": len(fixations["left"]),
+        "fixations_right": len(fixations["right"]),
+        "fixations_cyclopean": len(fixations["cyclopean"]),
+        "unmatched_left": int(np.count_nonzero(left_matches < 0)),
+        "unmatched_right": int(np.count_nonzero(right_matches < 0)),
+        "mean_centroid_distance": f"{distances.mean():.2f}" if len(distances) else "",
+    }
+
+
+def process_binocular(
+    trials: Iterator[BinocularArrays], args: dict, fixation_writer=None
+) -> Iterator[dict]:
+    """
+    Detect the fixations of every trial for all eyes and yield the
+    disagreement report rows. If given, fixation_writer (a csv.writer)
+    gets every fixation with its eye.
+    """
+    for tid, times, x_left, y_left, x_right, y_right in trials:
+        fixations = detect_binocular(times, x_left, y_left, x_right, y_right, args)
+        if fixation_writer is not None:
+            for eye in EYES:
+                for fixation in fixations[eye].tolist():
+                    fixation_writer.writerow([tid, eye, *fixation])
+        yield disagreement(
+            tid, x_left, y_left, x_right, y_right, fixations, args["max_offset"]
+        )
+
+
+def open_binocular_trials(args: dict) -> Iterator[BinocularArrays]:
+    if args["cache"]:
+        import cache
+        return cache.cached_binocular_arrays(args["input"], args["cache"])
+    elif args["input"]:
+        return read_binocular_arrays(open(args["input"], encoding="utf8", newline=""))
+    else:
+        return read_binocular_arrays(sys.stdin)
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Detect fixations of the left eye, the right eye and the cyclopean gaze in"
+            " one pass and report the disagreement between the eyes per trial."
+        )
+    )
+    import detectors
+
+    parser.add_argument(
+        "--mode",
+        default="dispersion",
+        choices=list(detectors.DETECTORS),
+        help="Algorithm used for detection (see fixations.py --help).",
+    )
+    parser.add_argument(
+        "--freq", type=int, required=True, help="Sampling frequency of given dataset."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help=(
+            "Dispersion threshold for dispersion-based mode. Maximum velocity threshold"
+            " for velocity-based mode."
+        ),
+    )
+    parser.add_argument(
+        "--max-offset",
+        type=float,
+        default=50,
+        help=(
+            "Distance (in pixels) between the eyes above which a sample counts as"
+            " disagreeing."
+        ),
+    )
+    parser.add_argument(
+        "--fixations",
+        help=(
+            "Also write all fixations (trialId, eye, start_time, end_time, x, y) as CSV"
+            " to this file."
+        ),
+    )
+    parser.add_argument("--input", help="CSV file to read instead of stdin.")
+    parser.add_argument(
+        "--cache",
+        help=(
+            "Directory for a binary cache of the parsed --input file, reused by later"
+            " runs."
+        ),
+    )
+
+    args = parser.parse_args()
+    if args.threshold is None and detectors.DETECTORS[args.mode].needs_threshold:
+        parser.error(f"--mode {args.mode} needs a --threshold")
+    if args.cache and not args.input:
+        parser.error("--cache needs an --input file")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    fixation_file = None
+    fixation_writer = None
+    if args["fixations"]:
+        fixation_file = open(args["fixations"], "w", encoding="utf8", newline="")
+        fixation_writer = csv.writer(fixation_file, lineterminator="\n")
+        fixation_writer.writerow(["trialId", "eye", "start_time", "end_time", "x", "y"])
+
+    writer = csv.DictWriter(
+        sys.stdout, REPORT_COLUMNS, delimiter="\t", lineterminator="\n"
+    )
+    writer.writeheader()
+    for row in process_binocular(open_binocular_trials(args), args, fixation_writer):
+        writer.writerow(row)
+
+    if fixation_file is not None:
+        fixation_file.close()
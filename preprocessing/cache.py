@@ -0,0 +1,246 @@
+"""
+On-disk cache of parsed recordings.
+
+The first time a CSV is read, its samples are written as raw binary columns
+(one file per column, NaN for missing coordinates) together with the trial
+boundaries. Later runs memory-map these files instead of parsing the CSV
+again. Cache entries are keyed by the SHA-1 of the CSV; an index of file
+sizes and modification times avoids rehashing files that did not change.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from fixations import (
+    BINOCULAR_COLUMNS,
+    BinocularArrays,
+    TrialArrays,
+    count_samples,
+    eye_columns,
+    merge_trial_segments,
+    read_column_chunks,
+)
+
+
+CACHE_VERSION = 1
+COLUMNS = {
+    "time": np.int64,
+    "x_left": np.float64,
+    "y_left": np.float64,
+    "x_right": np.float64,
+    "y_right": np.float64,
+}
+INDEX_FILENAME = "index.json"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_index(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILENAME), encoding="utf8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_json(path: str, data: dict):
+    # Write to a temporary file first so that readers never see half a file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf8") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def source_digest(path: str, cache_dir: str) -> str:
+    """
+    Return the SHA-1 of the source file, reusing the indexed hash as long as
+    its size and modification time are unchanged.
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    index = read_index(cache_dir)
+    known = index.get(key)
+    if (
+        known is not None
+        and known["size"] == stat.st_size
+        and known["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return known["sha1"]
+
+    digest = file_hash(path)
+    index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": digest}
+    write_json(os.path.join(cache_dir, INDEX_FILENAME), index)
+    return digest
+
+
+def build_cache(path: str, entry: str, chunk_size: int = 100000):
+    """
+    Parse the CSV at path once and write all sample columns plus the trial
+    offset index to the directory entry.
+    """
+    temporary = f"{entry}.{os.getpid()}.tmp"
+    os.makedirs(temporary, exist_ok=True)
+    outputs = {
+        name: open(os.path.join(temporary, f"{name}.bin"), "wb") for name in COLUMNS
+    }
+    trial_ids = []
+    offsets = []
+    samples = 0
+    try:
+        with open(path, encoding="utf8", newline="") as file:
+            for ids, *columns in read_column_chunks(
+                file, ("trialId", *COLUMNS), chunk_size
+            ):
+                if len(ids) == 0:
+                    continue
+                starts = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+                if not trial_ids or ids[0] != trial_ids[-1]:
+                    starts = np.concatenate(([0], starts))
+                for start in starts.tolist():
+                    trial_ids.append(str(ids[start]))
+                    offsets.append(samples + start)
+
+                for (name, dtype), column in zip(COLUMNS.items(), columns):
+                    if dtype is np.float64:
+                        column[column == ""] = "nan"
+                    column.astype(dtype).tofile(outputs[name])
+                samples += len(ids)
+    finally:
+        for output in outputs.values():
+            output.close()
+
+    offsets.append(samples)
+    np.save(os.path.join(temporary, "trial_offsets.npy"), np.array(offsets, np.int64))
+    write_json(
+        os.path.join(temporary, "meta.json"),
+        {
+            "version": CACHE_VERSION,
+            "source": os.path.abspath(path),
+            "samples": samples,
+            "trial_ids": trial_ids,
+        },
+    )
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(temporary, entry)
+
+
+def open_cache(path: str, cache_dir: str) -> str:
+    """
+    Return the cache entry directory for the CSV at path, building it first
+    if there is no up-to-date entry yet.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, source_digest(path, cache_dir))
+    try:
+        with open(os.path.join(entry, "meta.json"), encoding="utf8") as file:
+            valid = json.load(file)["version"] == CACHE_VERSION
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        valid = False
+    if not valid:
+        build_cache(path, entry)
+    return entry
+
+
+def load_columns(entry: str, *names: str) -> Tuple[dict, np.ndarray, list]:
+    """
+    Memory-map the given sample columns of a cache entry. Returns the columns
+    by name, the trial offsets and the trial ids.
+    """
+    with open(os.path.join(entry, "meta.json"), encoding="utf8") as file:
+        meta = json.load(file)
+    columns = {}
+    for name in names:
+        if meta["samples"] == 0:
+            # np.memmap refuses to map empty files
+            columns[name] = np.empty(0, COLUMNS[name])
+        else:
+            columns[name] = np.memmap(
+                os.path.join(entry, f"{name}.bin"),
+                dtype=COLUMNS[name],
+                mode="r",
+                shape=(meta["samples"],),
+            )
+    offsets = np.load(os.path.join(entry, "trial_offsets.npy"))
+    return columns, offsets, meta["trial_ids"]
+
+
+def cached_trial_arrays(path: str, eye: str, cache_dir: str) -> Iterator[TrialArrays]:
+    """
+    Same trials as fixations.read_trial_arrays() for the CSV at path, but
+    served from the memory-mapped cache in cache_dir.
+    """
+    x, y = eye_columns(eye)
+    columns, offsets, trial_ids = load_columns(
+        open_cache(path, cache_dir), "time", x, y
+    )
+    times, xs, ys = columns["time"], columns[x], columns[y]
+
+    def segments():
+        for trial_id, start, end in zip(trial_ids, offsets[:-1], offsets[1:]):
+            # Skip missing data points
+            keep = ~(np.isnan(xs[start:end]) | np.isnan(ys[start:end]))
+            count_samples(len(keep), len(keep) - np.count_nonzero(keep))
+            if keep.all():
+                yield (trial_id, times[start:end], xs[start:end], ys[start:end])
+            elif keep.any():
+                yield (
+                    trial_id,
+                    times[start:end][keep],
+                    xs[start:end][keep],
+                    ys[start:end][keep],
+                )
+
+    return merge_trial_segments(segments())
+
+
+def cached_binocular_arrays(
+    path: str, cache_dir: str, keep_missing: bool = False
+) -> Iterator[BinocularArrays]:
+    """
+    Same trials as fixations.read_binocular_arrays() for the CSV at path,
+    served from the memory-mapped cache in cache_dir.
+    """
+    columns, offsets, trial_ids = load_columns(
+        open_cache(path, cache_dir), "time", *BINOCULAR_COLUMNS
+    )
+    times = columns["time"]
+    eyes = [columns[name] for name in BINOCULAR_COLUMNS]
+
+    def segments():
+        for trial_id, start, end in zip(trial_ids, offsets[:-1], offsets[1:]):
+            left = ~(np.isnan(eyes[0][start:end]) | np.isnan(eyes[1][start:end]))
+            right = ~(np.isnan(eyes[2][start:end]) | np.isnan(eyes[3][start:end]))
+            keep = left | right
+            count_samples(len(keep), len(keep) - np.count_nonzero(keep))
+            if keep_missing:
+                keep = np.ones(len(keep), dtype=bool)
+            if keep.any():
+                # Copy the coordinates so that a half-missing eye can be set to NaN
+                x_left, y_left, x_right, y_right = (
+                    eye[start:end][keep] for eye in eyes
+                )
+                x_left[~left[keep]] = np.nan
+                y_left[~left[keep]] = np.nan
+                x_right[~right[keep]] = np.nan
+                y_right[~right[keep]] = np.nan
+                yield (
+                    trial_id,
+                    times[start:end][keep],
+                    x_left,
+                    y_left,
+                    x_right,
+                    y_right,
+                )
+
+    return merge_trial_segments(segments())
@@ -0,0 +1,309 @@
+"""
+Registry of the fixation detection algorithms.
+
+Every detector takes the samples of a trial as time/x/y arrays plus the
+parsed command line arguments and returns its fixations as a FIXATION_DTYPE
+record array, so the detectors can be swapped (--mode) and benchmarked
+without special cases. New detectors are added with @register.
+
+Besides the dispersion- and velocity-based algorithms, two detectors adapt
+to the data instead of relying on a fixed threshold (which is hard to pick,
+especially at 2000 Hz, see Task4.txt):
+
+adaptive  velocity threshold estimated per trial from the noise level of
+          the velocities, after Nyström & Holmqvist (2010)
+hmm       two-state hidden Markov model of the (log) velocities, fitted per
+          trial with Baum-Welch, after Salvucci & Goldberg (2000)
+"""
+
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from fixations import (
+    dispersion_based_fixations_array,
+    fixation_records,
+    sample_velocities,
+    velocity_based_fixations_array,
+    velocity_fixations,
+)
+
+
+class Detector(NamedTuple):
+    function: Callable[[np.ndarray, np.ndarray, np.ndarray, dict], np.ndarray]
+    needs_threshold: bool
+    description: str
+
+
+DETECTORS: Dict[str, Detector] = {}
+
+# Span (in seconds) over which positions are smoothed before computing the
+# velocities for the adaptive detectors
+SMOOTHING = 0.02
+# Minimum duration (in seconds) of a saccade for the adaptive detector
+MIN_SACCADE = 0.01
+# Ratio of the standard deviation to the median absolute deviation of normal data
+MAD_SCALE = 1.4826
+# Lower bound (in pixels per ms) of the velocity sd, for gaze with so little
+# (or so coarsely quantized) noise that most velocities equal the median
+MIN_SD = 0.03
+
+
+def register(name: str, needs_threshold: bool = True):
+    """
+    Decorator that adds a detector function to DETECTORS. The first
+    paragraph of its docstring is the description shown in --help.
+    """
+
+    def decorator(function):
+        description = " ".join((function.__doc__ or "").split("\n\n")[0].split())
+        DETECTORS[name] = Detector(function, needs_threshold, description)
+        return function
+
+    return decorator
+
+
+@register("dispersion")
+def dispersion(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    """
+    Dispersion-based (I-DT), --threshold is the maximum dispersion.
+    """
+    return dispersion_based_fixations_array(
+        times, xs, ys, args["threshold"], 0.2 / args["freq"]
+    )
+
+
+@register("velocity")
+def velocity(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    """
+    Velocity-based (I-VT), --threshold is the maximum velocity.
+    """
+    # NOTE: The maximum velocity parameter is highly dependent on the sampling
+    # frequency (as mentioned in the paper)
+    return fixation_records(
+        velocity_based_fixations_array(
+            times, xs, ys, args["threshold"], 1000 / args["freq"]
+        )
+    )
+
+
+def smoothed(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average over an odd number of samples; the window
+    shrinks at the edges.
+    """
+    if window <= 1 or len(values) == 0:
+        return values
+    half = window // 2
+    sums = np.concatenate(([0], np.cumsum(values)))
+    indices = np.arange(len(values))
+    low = np.maximum(indices - half, 0)
+    high = np.minimum(indices + half + 1, len(values))
+    return (sums[high] - sums[low]) / (high - low)
+
+
+def smoothed_velocities(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, freq: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    sample_velocities() of the gaze positions smoothed over about 20 ms, so
+    that at high sampling rates the sensor noise between neighbouring samples
+    doesn't dominate the velocities.
+    """
+    window = int(round(SMOOTHING * freq)) | 1
+    return sample_velocities(
+        times, smoothed(xs, window), smoothed(ys, window), 1000 / freq
+    )
+
+
+def adaptive_threshold(
+    velocity: np.ndarray,
+    initial: Optional[float] = None,
+    tolerance: float = 1e-3,
+    iterations: int = 100,
+) -> Tuple[float, float]:
+    """
+    Peak and onset velocity thresholds after Nystrom & Holmqvist: starting
+    high (default: the highest velocity), the peak threshold is set to
+    median + 6 sd of the velocities below it until it converges; the onset
+    threshold is median + 3 sd. The sd is estimated from the median absolute
+    deviation, because with mean and sd the saccades (a sixth of the samples
+    in reading) inflate the estimate enough for the threshold to settle above
+    them. It is at least MIN_SD: otherwise a median absolute deviation of 0
+    would put both thresholds on the median and make every sample that moves
+    at all part of a saccade.
+    """
+    threshold = float(velocity.max()) if initial is None else initial
+    below = velocity
+    for _ in range(iterations):
+        below = velocity[velocity < threshold]
+        if len(below) < 2:
+            break
+        median = np.median(below)
+        sd = max(MAD_SCALE * np.median(np.abs(below - median)), MIN_SD)
+        updated = median + 6 * sd
+        converged = abs(updated - threshold) <= tolerance * max(threshold, 1e-12)
+        threshold = updated
+        if converged:
+            break
+    if len(below) < 2:
+        return threshold, threshold
+    return threshold, median + 3 * sd
+
+
+def saccades(
+    velocity: np.ndarray, peak: float, onset: float, min_pairs: int = 1
+) -> np.ndarray:
+    """
+    True for the sample pairs in a saccade: a run of at least min_pairs
+    velocities strictly above the onset threshold that reaches the peak
+    threshold somewhere. Other runs are noise and stay part of the fixation.
+    """
+    fast = velocity > onset
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], fast, [False]))))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    if len(run_starts) == 0:
+        return fast
+    peaks = np.maximum.reduceat(velocity, run_starts)[: len(run_starts)]
+    # reduceat runs to the next start, so only the run itself may reach the peak
+    accepted = (peaks >= peak) & (run_ends - run_starts >= min_pairs)
+    reaching = np.zeros(len(velocity) + 1, dtype=int)
+    np.add.at(reaching, run_starts, accepted)
+    np.add.at(reaching, run_ends, -accepted.astype(int))
+    return fast & (np.cumsum(reaching)[:-1] > 0)
+
+
+@register("adaptive", needs_threshold=False)
+def adaptive(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    """
+    Velocity-based with a per-trial threshold (Nystrom-Holmqvist),
+    --threshold is only the starting point (default: highest velocity).
+    """
+    times = np.asarray(times)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    pairs, velocity = smoothed_velocities(times, xs, ys, args["freq"])
+    if len(velocity) == 0:
+        return fixation_records(velocity_fixations(times, xs, ys, pairs, velocity < 0))
+    peak, onset = adaptive_threshold(velocity, args.get("threshold"))
+    min_pairs = max(1, int(MIN_SACCADE * args["freq"]))
+    fast = saccades(velocity, peak, onset, min_pairs)
+    return fixation_records(velocity_fixations(times, xs, ys, pairs, ~fast))
+
+
+def prefix_products(matrices: np.ndarray) -> np.ndarray:
+    """
+    Normalized running products M[0] @ M[1] @ ... @ M[t] of a stack of
+    non-negative 2x2 matrices, computed with a parallel prefix scan (log2(n)
+    vectorized steps instead of a loop over the samples). Every product is
+    scaled to sum to 1, which keeps the values in range and doesn't change
+    the normalized probabilities derived from it.
+    """
+    # Entries as rows of a 4 x n array: a b / c d
+    products = matrices.reshape(-1, 4).T / matrices.sum(axis=(1, 2))
+    step = 1
+    while step < products.shape[1]:
+        a, b, c, d = products[:, :-step]
+        e, f, g, h = products[:, step:]
+        combined = np.array(
+            [a * e + b * g, a * f + b * h, c * e + d * g, c * f + d * h]
+        )
+        products[:, step:] = combined / combined.sum(axis=0)
+        step *= 2
+    return products.T.reshape(-1, 2, 2)
+
+
+def hmm_posteriors(
+    observations: np.ndarray,
+    means: np.ndarray,
+    sds: np.ndarray,
+    transitions: np.ndarray,
+    initial: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Forward-backward for a two-state HMM with Gaussian emissions. Returns the
+    state posteriors (n x 2) and the expected transition counts (2 x 2).
+    """
+    n = len(observations)
+    emissions = np.exp(-0.5 * ((observations[:, None] - means) / sds) ** 2) / sds
+    emissions = np.maximum(emissions, 1e-300)
+
+    # alpha[t] ~ initial @ diag(e[0]) @ A @ diag(e[1]) @ ... @ A @ diag(e[t])
+    steps = transitions[None, :, :] * emissions[1:, None, :]
+    start = initial * emissions[0]
+    forward = (
+        np.concatenate([[np.eye(2)], prefix_products(steps)])
+        if n > 1
+        else np.eye(2)[None]
+    )
+    alpha = np.einsum("i,tij->tj", start, forward)
+    alpha /= alpha.sum(axis=1, keepdims=True)
+
+    # beta[t] ~ A @ diag(e[t+1]) @ ... @ A @ diag(e[n-1]) @ 1
+    backward = (
+        prefix_products(steps[::-1].transpose(0, 2, 1))[::-1].transpose(0, 2, 1)
+        if n > 1
+        else np.zeros((0, 2, 2))
+    )
+    beta = np.concatenate([backward.sum(axis=2), np.ones((1, 2))])
+    beta /= beta.sum(axis=1, keepdims=True)
+
+    posteriors = alpha * beta
+    posteriors /= posteriors.sum(axis=1, keepdims=True)
+    # xi[t, i, j] ~ alpha[t, i] A[i, j] e[t+1, j] beta[t+1, j]
+    xi = alpha[:-1, :, None] * steps * beta[1:, None, :]
+    xi /= np.maximum(xi.sum(axis=(1, 2), keepdims=True), 1e-300)
+    return posteriors, xi.sum(axis=0)
+
+
+def hmm_states(observations: np.ndarray, iterations: int = 10) -> np.ndarray:
+    """
+    Fit a two-state HMM to the observations with Baum-Welch and return the
+    most likely state of every observation (0 for the state with the lower
+    mean).
+    """
+    if len(observations) < 2:
+        return np.zeros(len(observations), dtype=int)
+    means = np.percentile(observations, [25, 95]).astype(float)
+    sds = np.full(2, max(observations.std(), 1e-6))
+    transitions = np.array([[0.95, 0.05], [0.05, 0.95]])
+    initial = np.array([0.5, 0.5])
+    for _ in range(iterations):
+        posteriors, expected = hmm_posteriors(
+            observations, means, sds, transitions, initial
+        )
+        weights = np.maximum(posteriors.sum(axis=0), 1e-12)
+        means = (posteriors * observations[:, None]).sum(axis=0) / weights
+        sds = np.sqrt(
+            (posteriors * (observations[:, None] - means) ** 2).sum(axis=0) / weights
+        )
+        sds = np.maximum(sds, 1e-6)
+        transitions = expected / np.maximum(expected.sum(axis=1, keepdims=True), 1e-300)
+        initial = posteriors[0]
+    posteriors, _ = hmm_posteriors(observations, means, sds, transitions, initial)
+    states = posteriors.argmax(axis=1)
+    return states if means[0] <= means[1] else 1 - states
+
+
+@register("hmm", needs_threshold=False)
+def hmm(times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict) -> np.ndarray:
+    """
+    Hidden Markov model (I-HMM) with a fixation and a saccade state fitted
+    per trial, no threshold needed.
+    """
+    times = np.asarray(times)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    pairs, velocity = smoothed_velocities(times, xs, ys, args["freq"])
+    states = hmm_states(np.log(velocity + 1e-6))
+    return fixation_records(velocity_fixations(times, xs, ys, pairs, states == 0))
+
+
+def detect(times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict) -> np.ndarray:
+    return DETECTORS[args["mode"]].function(times, xs, ys, args)
@@ -0,0 +1,424 @@
+"""
+Export of the fixation, log and reading-measure tables as columnar Arrow
+datasets (Parquet or Feather files), for R's arrow package.
+
+Use like this:
+python3 export.py --study study --logs ../experiment/results \
+    --measures dataJMVV.txt --output export
+
+Every source becomes a directory of the output, partitioned hive-style
+(participant=3/trial=12/part-0.parquet) so that a reader can skip whole
+participants or trials and read only the columns it needs:
+
+fixations      detected fixations, from a batch.py study (--study) or a CSV
+               written by fixations.py --stream csv or batch.py --csv
+               (--fixations): participant, trial, start, end, x, y
+log_fixations  the fixation starts logged by experiment.py (--logs, indexed
+               with logs.py): participant, trialnr, stimulus and the
+               columns of logs.FIXATION_COLUMNS
+log_trials     one row per logged trial with its stimulus, area of interest
+               and times, partitioned by participant only
+measures       a table of measures.py (--measures), partitioned by subj
+
+Repeated strings (participant names, trial ids, stimulus texts, item and
+condition labels) are dictionary-encoded, so each text is stored once per
+file and arrives in R as a factor. Positions, times and measures keep their
+numeric types instead of going through text. The study and log datasets are
+written in batches of participants straight from their memory-mapped
+columns.
+
+pyarrow is an optional dependency, only needed for this script.
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import sys
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from logs import FIXATION_COLUMNS
+
+
+FORMATS = ["parquet", "feather"]
+PARTITIONS = ["trial", "participant", "none"]
+# Rows per record batch when streaming a dataset from memory-mapped columns
+BATCH_ROWS = 1 << 20
+
+
+def available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def dictionary(codes: np.ndarray, values: List[str]):
+    """
+    Dictionary-encoded strings from integer codes into values; negative
+    codes are nulls.
+    """
+    import pyarrow as pa
+
+    codes = np.asarray(codes, dtype=np.int32)
+    missing = codes < 0
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes, mask=missing if missing.any() else None),
+        pa.array(values, type=pa.string()),
+    )
+
+
+def numeric(column: np.ndarray) -> np.ndarray:
+    """
+    Text column of a TSV table as integers, or as floats if not all values
+    are integers.
+    """
+    try:
+        return column.astype(np.int64)
+    except ValueError:
+        return column.astype(np.float64)
+
+
+def batches(length: int, boundaries: np.ndarray) -> Iterator[slice]:
+    """
+    Slices of about BATCH_ROWS rows that only end at the given boundaries
+    (e.g. the first row of every participant).
+    """
+    start = 0
+    while start < length:
+        last = np.searchsorted(boundaries, start + BATCH_ROWS, side="right") - 1
+        stop = int(boundaries[last])
+        if stop <= start:
+            stop = int(boundaries[np.searchsorted(boundaries, start, side="right")])
+        yield slice(start, stop)
+        start = stop
+
+
+def study_batches(study) -> Iterator:
+    """
+    Record batches of the fixations of a batch.StudyDataset.
+    """
+    import pyarrow as pa
+
+    fixations = study.fixations
+    trial_ids, trial_codes = np.unique(
+        [trial_id for _, trial_id in study.trials], return_inverse=True
+    )
+    trial_ids = trial_ids.tolist()
+    participant_starts = np.searchsorted(
+        fixations["participant"], np.arange(len(study.participants) + 1)
+    )
+    for rows in batches(len(fixations), participant_starts):
+        chunk = fixations[rows]
+        yield pa.RecordBatch.from_arrays(
+            [
+                dictionary(chunk["participant"], study.participants),
+                dictionary(trial_codes[chunk["trial"]], trial_ids),
+                pa.array(chunk["start"]),
+                pa.array(chunk["end"]),
+                pa.array(chunk["x"]),
+                pa.array(chunk["y"]),
+            ],
+            ["participant", "trial", "start", "end", "x", "y"],
+        )
+
+
+def read_fixations_csv(path: str, participant: Optional[str]):
+    """
+    Table of a fixation CSV (trialId, start_time, end_time, x, y and, from
+    batch.py, participant). participant names the participant of files
+    without the column.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv
+
+    table = csv.read_csv(
+        path,
+        convert_options=csv.ConvertOptions(
+            column_types={
+                "participant": pa.string(),
+                "trialId": pa.string(),
+                "start_time": pa.int64(),
+                "end_time": pa.int64(),
+                "x": pa.float64(),
+                "y": pa.float64(),
+            }
+        ),
+    )
+    if "participant" not in table.column_names:
+        if participant is None:
+            raise ValueError(
+                f"{path} has no participant column, so --participant is needed"
+            )
+        table = table.add_column(
+            0, "participant", pa.array([participant] * len(table), pa.string())
+        )
+    return pa.table(
+        {
+            "participant": pc.dictionary_encode(table["participant"]),
+            "trial": pc.dictionary_encode(table["trialId"]),
+            "start": table["start_time"],
+            "end": table["end_time"],
+            "x": table["x"],
+            "y": table["y"],
+        }
+    )
+
+
+def log_fixation_batches(dataset) -> Iterator:
+    """
+    Record batches of the fixations of a logs.LogDataset, with the stimulus
+    of their trial.
+    """
+    import pyarrow as pa
+
+    fixations = dataset.fixations
+    trials = dataset.trials
+    stimuli = np.repeat(trials["stimulus"], trials["count"])
+    offsets = np.append(trials["offset"], len(fixations["trialnr"]))
+    participant_starts = offsets[dataset.participant_offsets]
+    for rows in batches(len(fixations["trialnr"]), participant_starts):
+        arrays = {
+            "participant": dictionary(
+                fixations["participant"][rows], dataset.participants
+            ),
+            "trialnr": pa.array(fixations["trialnr"][rows]),
+            "stimulus": dictionary(stimuli[rows], dataset.stimuli),
+        }
+        for name in FIXATION_COLUMNS:
+            if name not in arrays:
+                arrays[name] = pa.array(np.asarray(fixations[name][rows]))
+        yield pa.RecordBatch.from_arrays(list(arrays.values()), list(arrays))
+
+
+def log_trial_table(dataset):
+    import pyarrow as pa
+
+    trials = dataset.trials
+    columns = {
+        "participant": dictionary(trials["participant"], dataset.participants),
+        "trialnr": pa.array(trials["trialnr"]),
+        "stimulus": dictionary(trials["stimulus"], dataset.stimuli),
+        "fixations": pa.array(trials["count"]),
+    }
+    for name in ("aoi_x", "aoi_y", "aoi_w", "aoi_h", "start_time", "end_time"):
+        columns[name] = pa.array(np.asarray(trials[name]))
+    return pa.table(columns)
+
+
+def measure_arrow_table(table: Dict[str, np.ndarray]):
+    """
+    Arrow table of a measures.py table read with measures.read_table: the
+    trial labels dictionary-encoded, everything else numeric.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    from measures import TRIAL_COLUMNS
+
+    return pa.table(
+        {
+            name: pc.dictionary_encode(pa.array(column.tolist(), pa.string()))
+            if name in TRIAL_COLUMNS
+            else pa.array(numeric(column))
+            for name, column in table.items()
+        }
+    )
+
+
+def write(data, schema, path: str, partitioning: List[str], args: dict):
+    """
+    Write a table or record batches as a dataset to path, replacing what was
+    there.
+    """
+    import pyarrow.dataset as ds
+
+    shutil.rmtree(path, ignore_errors=True)
+    ds.write_dataset(
+        data,
+        path,
+        schema=schema,
+        format=args["format"],
+        partitioning=partitioning or None,
+        partitioning_flavor="hive" if partitioning else None,
+        basename_template="part-{i}." + args["format"],
+        max_partitions=1 << 20,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def fixation_partitioning(args: dict, trial: str) -> List[str]:
+    return {
+        "trial": ["participant", trial],
+        "participant": ["participant"],
+        "none": [],
+    }[args["partition"]]
+
+
+def export_study(args: dict) -> int:
+    import pyarrow as pa
+
+    from batch import StudyDataset
+
+    study = StudyDataset(args["study"])
+    schema = pa.schema(
+        [
+            ("participant", pa.dictionary(pa.int32(), pa.string())),
+            ("trial", pa.dictionary(pa.int32(), pa.string())),
+            ("start", pa.int64()),
+            ("end", pa.int64()),
+            ("x", pa.float64()),
+            ("y", pa.float64()),
+        ]
+    )
+    write(
+        study_batches(study),
+        schema,
+        os.path.join(args["output"], "fixations"),
+        fixation_partitioning(args, "trial"),
+        args,
+    )
+    return len(study.fixations)
+
+
+def export_fixations_csv(args: dict) -> int:
+    table = read_fixations_csv(args["fixations"], args["participant"])
+    write(
+        table,
+        table.schema,
+        os.path.join(args["output"], "fixations"),
+        fixation_partitioning(args, "trial"),
+        args,
+    )
+    return len(table)
+
+
+def export_logs(args: dict) -> int:
+    import pyarrow as pa
+
+    from logs import open_dataset
+
+    dataset = open_dataset(
+        args["logs"], args["dataset"] or os.path.join(args["output"], ".logs")
+    )
+    text = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [("participant", text), ("trialnr", pa.int32()), ("stimulus", text)]
+        + [
+            (name, pa.from_numpy_dtype(np.dtype(dtype)))
+            for name, dtype in FIXATION_COLUMNS.items()
+            if name not in ("participant", "trialnr")
+        ]
+    )
+    path = os.path.join(args["output"], "log_fixations")
+    write(
+        log_fixation_batches(dataset),
+        schema,
+        path,
+        fixation_partitioning(args, "trialnr"),
+        args,
+    )
+    trials = log_trial_table(dataset)
+    partitioning = [] if args["partition"] == "none" else ["participant"]
+    write(
+        trials,
+        trials.schema,
+        os.path.join(args["output"], "log_trials"),
+        partitioning,
+        args,
+    )
+    return len(dataset.fixations["trialnr"])
+
+
+def export_measures(args: dict) -> int:
+    from measures import read_table
+
+    with open(args["measures"], encoding="utf8", newline="") as file:
+        table = measure_arrow_table(read_table(file))
+    partitioning = (
+        ["subj"] if args["partition"] != "none" and "subj" in table.column_names else []
+    )
+    write(
+        table,
+        table.schema,
+        os.path.join(args["output"], "measures"),
+        partitioning,
+        args,
+    )
+    return len(table)
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Export fixations, experiment logs and reading measures as partitioned"
+            " Parquet or Feather datasets."
+        )
+    )
+    parser.add_argument("--output", required=True, help="Directory for the datasets.")
+    parser.add_argument("--study", help="Study directory written by batch.py.")
+    parser.add_argument(
+        "--fixations",
+        help="Fixation CSV written by fixations.py --stream csv or batch.py --csv.",
+    )
+    parser.add_argument(
+        "--participant",
+        help="Participant of a --fixations file without a participant column.",
+    )
+    parser.add_argument("--logs", help="Directory with the logs of experiment.py.")
+    parser.add_argument(
+        "--dataset",
+        help=(
+            "Directory for the logs.py dataset of --logs (default: .logs in --output)."
+        ),
+    )
+    parser.add_argument("--measures", help="Table written by measures.py.")
+    parser.add_argument(
+        "--format",
+        default="parquet",
+        choices=FORMATS,
+        help="File format of the datasets.",
+    )
+    parser.add_argument(
+        "--partition",
+        default="trial",
+        choices=PARTITIONS,
+        help=(
+            "Partition the fixations by participant and trial, by participant only or"
+            " not at all."
+        ),
+    )
+
+    args = parser.parse_args()
+    if not (args.study or args.fixations or args.logs or args.measures):
+        parser.error(
+            "nothing to export, give --study, --fixations, --logs or --measures"
+        )
+    if args.study and args.fixations:
+        parser.error("--study and --fixations both export the fixations, give only one")
+    if not available():
+        parser.error("the export needs pyarrow (pip install pyarrow)")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+    os.makedirs(args["output"], exist_ok=True)
+
+    exports = [
+        ("study", "fixations", export_study),
+        ("fixations", "fixations", export_fixations_csv),
+        ("logs", "logged fixations", export_logs),
+        ("measures", "measure rows", export_measures),
+    ]
+    for source, what, export in exports:
+        if not args[source]:
+            continue
+        try:
+            rows = export(args)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(
+            f"{rows} {what} of {args[source]} exported to {args['output']}",
+            file=sys.stderr,
+        )
@@ -1,14 +1,38 @@
 import argparse
 import csv
+import json
 import math
+import os
 import sys
-from typing import List, TextIO, Iterator, Tuple
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from array import array
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from typing import Deque, Iterable, List, Optional, TextIO, Iterator, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
+
+import profiling
 
 
 DataPoint = Tuple[int, float, float]
 Fixation = Tuple[int, int, float, float]
+# start times, end times, centroid xs, centroid ys
+FixationArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+# trial id, times, xs, ys
+TrialArrays = Tuple[str, np.ndarray, np.ndarray, np.ndarray]
+
+# trial id, times, x_left, y_left, x_right, y_right (NaN where an eye is missing)
+BinocularArrays = Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+BINOCULAR_COLUMNS = ("x_left", "y_left", "x_right", "y_right")
+
+# Records of a trial's samples and fixations, 24 and 32 bytes each. The
+# columns of a record array (e.g. samples["x"]) are views, not copies.
+SAMPLE_DTYPE = np.dtype([("time", np.int64), ("x", np.float64), ("y", np.float64)])
+FIXATION_DTYPE = np.dtype(
+    [("start", np.int64), ("end", np.int64), ("x", np.float64), ("y", np.float64)]
+)
 
 
 def dispersion(points: List[DataPoint]) -> float:
@@ -44,6 +68,193 @@ def dispersion_based_fixations(
         yield (window[0][0], window[-1][0], *centroid(window))
 
 
+class DispersionWindow:
+    """
+    Sliding window of data points that answers dispersion and centroid
+    queries in constant time.
+
+    Minima and maxima are tracked with monotonic deques of (index, value)
+    pairs and the centroid with running sums, so appending a point or
+    dropping the oldest one is amortized O(1) instead of rescanning the
+    whole window like dispersion() and centroid() do.
+    """
+
+    def __init__(self):
+        self.points: Deque[DataPoint] = deque()
+        self._first = 0  # index of points[0] in the stream
+        self._next = 0  # index the next appended point will get
+        self._min_x: Deque[Tuple[int, float]] = deque()
+        self._max_x: Deque[Tuple[int, float]] = deque()
+        self._min_y: Deque[Tuple[int, float]] = deque()
+        self._max_y: Deque[Tuple[int, float]] = deque()
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def append(self, point: DataPoint):
+        _, x, y = point
+        i = self._next
+        self._next += 1
+        self.points.append(point)
+        self._sum_x += x
+        self._sum_y += y
+        while self._min_x and self._min_x[-1][1] >= x:
+            self._min_x.pop()
+        self._min_x.append((i, x))
+        while self._max_x and self._max_x[-1][1] <= x:
+            self._max_x.pop()
+        self._max_x.append((i, x))
+        while self._min_y and self._min_y[-1][1] >= y:
+            self._min_y.pop()
+        self._min_y.append((i, y))
+        while self._max_y and self._max_y[-1][1] <= y:
+            self._max_y.pop()
+        self._max_y.append((i, y))
+
+    def popleft(self) -> DataPoint:
+        point = self.points.popleft()
+        _, x, y = point
+        self._sum_x -= x
+        self._sum_y -= y
+        i = self._first
+        self._first += 1
+        for extremes in (self._min_x, self._max_x, self._min_y, self._max_y):
+            if extremes[0][0] == i:
+                extremes.popleft()
+        return point
+
+    def dispersion(self) -> float:
+        return (
+            abs(self._max_x[0][1] - self._min_x[0][1])
+            + abs(self._max_y[0][1] - self._min_y[0][1])
+        ) / 2
+
+    def centroid(self) -> Tuple[float, float]:
+        n = len(self.points)
+        return (self._sum_x / n, self._sum_y / n)
+
+    def fixation(self) -> Fixation:
+        return (self.points[0][0], self.points[-1][0], *self.centroid())
+
+
+def incremental_dispersion_based_fixations(
+    points: Iterable[DataPoint], dispersion_threshold: float, duration_threshold: int
+) -> Iterator[Fixation]:
+    """
+    Same algorithm as dispersion_based_fixations(), but backed by a
+    DispersionWindow so that each sample costs O(1) instead of O(window).
+    Start and end times are identical; centroids may differ from the
+    reference implementation in the last bits because of the running sums.
+    """
+    points = iter(points)
+    window = DispersionWindow()
+    while True:
+        try:
+            while len(window) < duration_threshold:
+                window.append(next(points))
+            if window.dispersion() <= dispersion_threshold:
+                while window.dispersion() <= dispersion_threshold:
+                    window.append(next(points))
+                yield window.fixation()
+            else:
+                window.popleft()
+        except StopIteration:
+            break
+    if len(window) >= duration_threshold:
+        yield window.fixation()
+
+
+def dispersion_based_fixations_array(
+    times: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    dispersion_threshold: float,
+    duration_threshold: float,
+) -> np.ndarray:
+    """
+    incremental_dispersion_based_fixations() for a trial given as time/x/y
+    arrays, returning a FIXATION_DTYPE record array with exactly the same
+    fixations. The window is a range of sample indices, so no data points
+    are built; the samples are read through memoryviews, which also works
+    for the strided columns of a SAMPLE_DTYPE array.
+    """
+    t = memoryview(np.asarray(times, dtype=np.int64))
+    x = memoryview(np.asarray(xs, dtype=np.float64))
+    y = memoryview(np.asarray(ys, dtype=np.float64))
+    n = len(t)
+    starts = array("q")
+    ends = array("q")
+    center_xs = array("d")
+    center_ys = array("d")
+
+    # The window holds the samples first <= i < end. Like in DispersionWindow,
+    # extremes are tracked with monotonic deques and the centroid with sums.
+    first = end = 0
+    min_x: Deque[Tuple[int, float]] = deque()
+    max_x: Deque[Tuple[int, float]] = deque()
+    min_y: Deque[Tuple[int, float]] = deque()
+    max_y: Deque[Tuple[int, float]] = deque()
+    sums = [0.0, 0.0]
+
+    def append(i: int):
+        xi = x[i]
+        yi = y[i]
+        sums[0] += xi
+        sums[1] += yi
+        while min_x and min_x[-1][1] >= xi:
+            min_x.pop()
+        min_x.append((i, xi))
+        while max_x and max_x[-1][1] <= xi:
+            max_x.pop()
+        max_x.append((i, xi))
+        while min_y and min_y[-1][1] >= yi:
+            min_y.pop()
+        min_y.append((i, yi))
+        while max_y and max_y[-1][1] <= yi:
+            max_y.pop()
+        max_y.append((i, yi))
+
+    def spread() -> float:
+        return (abs(max_x[0][1] - min_x[0][1]) + abs(max_y[0][1] - min_y[0][1])) / 2
+
+    def emit():
+        count = end - first
+        starts.append(t[first])
+        ends.append(t[end - 1])
+        center_xs.append(sums[0] / count)
+        center_ys.append(sums[1] / count)
+
+    while True:
+        while end - first < duration_threshold and end < n:
+            append(end)
+            end += 1
+        if end - first < duration_threshold:
+            break
+        if spread() <= dispersion_threshold:
+            while end < n:
+                append(end)
+                end += 1
+                if spread() > dispersion_threshold:
+                    break
+            else:
+                # The data ended within the fixation
+                break
+            emit()
+        else:
+            sums[0] -= x[first]
+            sums[1] -= y[first]
+            for extremes in (min_x, max_x, min_y, max_y):
+                if extremes[0][0] == first:
+                    extremes.popleft()
+            first += 1
+
+    if end - first >= duration_threshold:
+        emit()
+    return fixation_records((starts, ends, center_xs, center_ys))
+
+
 def velocity_based_fixations(
     points: List[DataPoint], max_velocity: float, time_diff: float
 ) -> Iterator[Fixation]:
@@ -76,69 +287,691 @@ def velocity_based_fixations(
         current_fixations = []
 
 
+def velocity_based_fixations_array(
+    times: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    max_velocity: float,
+    time_diff: float,
+) -> FixationArrays:
+    """
+    Vectorized version of velocity_based_fixations() for a whole trial given
+    as time/x/y arrays. Velocities are computed in one pass and fixations are
+    the runs of consecutive below-threshold sample pairs.
+    """
+    times = np.asarray(times)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    pairs, velocity = sample_velocities(times, xs, ys, time_diff)
+    return velocity_fixations(times, xs, ys, pairs, velocity < max_velocity)
+
+
+def sample_velocities(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, time_diff: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the indices of the sample pairs the velocity-based algorithm looks
+    at and their velocities. Pair k compares sample k - 1 with sample k.
+    """
+    # Like the generator version, pairs whose first sample has time 0 are
+    # skipped and don't end a run.
+    pairs = np.flatnonzero(times[:-1] != 0) + 1
+    velocity = (
+        np.sqrt((xs[pairs] - xs[pairs - 1]) ** 2 + (ys[pairs] - ys[pairs - 1]) ** 2)
+        / time_diff
+    )
+    return pairs, velocity
+
+
+def velocity_fixations(
+    times: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    pairs: np.ndarray,
+    slow: np.ndarray,
+) -> FixationArrays:
+    """
+    Turn the runs of slow sample pairs (see sample_velocities()) into
+    fixations.
+    """
+    # Run-length encode the slow pairs
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], slow, [False]))))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    if len(run_starts) == 0:
+        empty = np.empty(0)
+        return empty.astype(times.dtype), empty.astype(times.dtype), empty, empty
+
+    first = pairs[run_starts] - 1  # sample that opens each fixation
+    last = pairs[run_ends - 1]
+    # Each fixation holds the opening sample plus the second sample of every pair
+    bounds = np.stack([run_starts, run_ends], axis=1).ravel()
+    if bounds[-1] == len(pairs):
+        bounds = bounds[:-1]
+    counts = run_ends - run_starts + 1
+    center_x = (np.add.reduceat(xs[pairs], bounds)[0::2] + xs[first]) / counts
+    center_y = (np.add.reduceat(ys[pairs], bounds)[0::2] + ys[first]) / counts
+
+    return times[first], times[last], center_x, center_y
+
+
+def fixation_records(fixations: FixationArrays) -> np.ndarray:
+    """
+    Combine the columns of a FixationArrays into a FIXATION_DTYPE record
+    array.
+    """
+    records = np.empty(len(fixations[0]), FIXATION_DTYPE)
+    for name, column in zip(FIXATION_DTYPE.names, fixations):
+        records[name] = column
+    return records
+
+
+def sample_records(times: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    samples = np.empty(len(times), SAMPLE_DTYPE)
+    samples["time"] = times
+    samples["x"] = xs
+    samples["y"] = ys
+    return samples
+
+
+def fixation_list(fixations: FixationArrays) -> List[Fixation]:
+    return list(zip(*(column.tolist() for column in fixations)))
+
+
+def fixation_arrays(fixations: List[Fixation]) -> FixationArrays:
+    starts, ends, xs, ys = zip(*fixations) if fixations else ([], [], [], [])
+    return (
+        np.array(starts, np.int64),
+        np.array(ends, np.int64),
+        np.array(xs, float),
+        np.array(ys, float),
+    )
+
+
+def data_points(times: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> List[DataPoint]:
+    return list(zip(times.tolist(), xs.tolist(), ys.tolist()))
+
+
+def eye_columns(eye: str) -> Tuple[str, str]:
+    if eye == "left":
+        return "x_left", "y_left"
+    else:
+        return "x_right", "y_right"
+
+
 def read_trials(file: TextIO, eye: str) -> Iterator[List[DataPoint]]:
     reader = csv.DictReader(file)
     trial = []
     current_trial_id = None
+    missing = 0
 
-    if eye == "left":
-        x = "x_left"
-        y = "y_left"
-    else:
-        x = "x_right"
-        y = "y_right"
+    x, y = eye_columns(eye)
 
     for row in reader:
         # Skip missing data points
         if not row[x] or not row[y]:
+            missing += 1
             continue
         if row["trialId"] != current_trial_id:
             if current_trial_id is not None:
+                count_samples(len(trial) + missing, missing)
+                missing = 0
                 yield (current_trial_id, trial)
             trial = []
             current_trial_id = row["trialId"]
         trial.append((int(row["time"]), float(row[x]), float(row[y])))
+    count_samples(len(trial) + missing, missing)
+    if current_trial_id is not None:
+        yield (current_trial_id, trial)
+
+
+def count_samples(read: int, missing: int):
+    profiling.profile.count("samples_read", read)
+    profiling.profile.count("samples_missing", missing)
+
+
+def read_trial_arrays(
+    file: TextIO, eye: str, chunk_size: int = 100000
+) -> Iterator[TrialArrays]:
+    """
+    Columnar version of read_trials(). The CSV is parsed in chunks of
+    chunk_size rows into typed arrays, so memory is bounded by the chunk
+    size and the longest trial. Trials that fit into a single chunk are
+    yielded as views into that chunk's arrays.
+    """
+    x, y = eye_columns(eye)
+    return merge_trial_segments(
+        segment
+        for trial_ids, times, xs, ys in read_column_chunks(
+            file, ("trialId", "time", x, y), chunk_size
+        )
+        for segment in split_trial_segments(trial_ids, *parse_samples(times, xs, ys))
+    )
+
+
+def read_binocular_arrays(
+    file: TextIO, chunk_size: int = 100000, keep_missing: bool = False
+) -> Iterator[BinocularArrays]:
+    """
+    Read the samples of both eyes in one pass. Coordinates of a missing eye
+    are NaN; rows where both eyes are missing are skipped unless
+    keep_missing is set.
+    """
+    return merge_trial_segments(
+        segment
+        for trial_ids, *columns in read_column_chunks(
+            file, ("trialId", "time", *BINOCULAR_COLUMNS), chunk_size
+        )
+        for segment in split_trial_segments(
+            trial_ids, *parse_binocular_samples(*columns, keep_missing=keep_missing)
+        )
+    )
+
+
+def parse_binocular_samples(
+    times: np.ndarray, *coordinates: np.ndarray, keep_missing: bool = False
+) -> Tuple[np.ndarray, ...]:
+    """
+    Like parse_samples(), for the x_left, y_left, x_right and y_right
+    columns, keeping the samples with at least one eye (or all samples with
+    keep_missing).
+    """
+    left = coordinates[0].astype(bool) & coordinates[1].astype(bool)
+    right = coordinates[2].astype(bool) & coordinates[3].astype(bool)
+    keep = left | right
+    count_samples(len(keep), len(keep) - np.count_nonzero(keep))
+    if keep_missing:
+        keep = np.ones(len(keep), dtype=bool)
+    columns = [times[keep].astype(np.int64)]
+    for column, present in zip(coordinates, (left, left, right, right)):
+        values = np.full(len(column), np.nan)
+        values[present] = column[present].astype(float)
+        columns.append(values[keep])
+    return (keep, *columns)
+
+
+def read_column_chunks(
+    file: TextIO, names: Iterable[str], chunk_size: int = 100000
+) -> Iterator[List[np.ndarray]]:
+    """
+    Read the given CSV columns in chunks of chunk_size rows. Each chunk is a
+    list of object arrays holding the raw strings of one column.
+    """
+    header = next(csv.reader([file.readline()]), None)
+    if header is None:
+        return
+    width = len(header)
+    columns = [header.index(name) for name in names]
+    while True:
+        lines = list(islice(file, chunk_size))
+        if not lines:
+            break
+        fields = split_fields(lines, width)
+        yield [np.array(fields[column::width], dtype=object) for column in columns]
+
+
+def parse_samples(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convert raw time and coordinate strings. Returns a mask of the samples
+    that have both coordinates, plus the columns of those samples (views
+    into one SAMPLE_DTYPE record array).
+    """
+    # Skip missing data points
+    keep = xs.astype(bool) & ys.astype(bool)
+    count_samples(len(keep), len(keep) - np.count_nonzero(keep))
+    samples = np.empty(np.count_nonzero(keep), SAMPLE_DTYPE)
+    samples["time"] = times[keep]
+    samples["x"] = xs[keep]
+    samples["y"] = ys[keep]
+    return keep, samples["time"], samples["x"], samples["y"]
+
+
+def split_trial_segments(
+    trial_ids: np.ndarray, keep: np.ndarray, *columns: np.ndarray
+) -> Iterator[TrialArrays]:
+    """
+    Split the kept rows of a chunk into (trial id, *columns) segments.
+    """
+    trial_ids = trial_ids[keep]
+    bounds = np.flatnonzero(trial_ids[1:] != trial_ids[:-1]) + 1
+    starts = np.concatenate(([0], bounds)).astype(int)
+    ends = np.concatenate((bounds, [len(trial_ids)])).astype(int)
+    for start, end in zip(starts, ends):
+        if start < end:
+            yield (str(trial_ids[start]), *(column[start:end] for column in columns))
+
+
+def merge_trial_segments(segments: Iterable[TrialArrays]) -> Iterator[TrialArrays]:
+    """
+    Join consecutive segments with the same trial id, e.g. a trial that spans
+    two chunks or one that is interrupted by rows with missing data.
+    """
+    pending_id = None
+    pending = []
+    for trial_id, *columns in segments:
+        if trial_id != pending_id:
+            if pending:
+                yield merge_trial_parts(pending_id, pending)
+            pending_id = trial_id
+            pending = []
+        pending.append(columns)
+    if pending:
+        yield merge_trial_parts(pending_id, pending)
+
+
+def split_fields(lines: List[str], width: int) -> List[str]:
+    """
+    Split CSV lines into one flat list of fields. Plain numeric exports are
+    split in one go; anything else (quoting, blank or ragged lines) falls
+    back to the csv module.
+    """
+    text = "".join(lines)
+    # Every line must have all fields, or the fields of a short line and a
+    # long one would end up in each other's columns
+    if '"' not in text and np.all(np.char.count(lines, ",") == width - 1):
+        return text.replace("\r\n", "\n").rstrip("\n").replace("\n", ",").split(",")
+    fields = []
+    for row in csv.reader(lines):
+        if row:
+            fields.extend((row + [""] * width)[:width])
+    return fields
+
+
+def merge_trial_parts(trial_id: str, parts: List[List[np.ndarray]]) -> TrialArrays:
+    if len(parts) == 1:
+        return (trial_id, *parts[0])
+    return (trial_id, *(np.concatenate(column) for column in zip(*parts)))
+
+
+def detect_fixations(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    """
+    Fixations of a trial as a FIXATION_DTYPE record array.
+    """
+    with profiling.profile.span(f"detect.{args['mode']}"):
+        fixations = run_detector(times, xs, ys, args)
+    profiling.profile.count("trials")
+    profiling.profile.count("fixations", len(fixations))
+    return fixations
+
+
+def run_detector(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    import detectors
+
+    return detectors.detect(times, xs, ys, args)
+
+
+# One renderer per process, created on first use
+renderer = None
+
+
+def plot_trial(
+    tid: str, xs: np.ndarray, ys: np.ndarray, fixations: np.ndarray, png: str
+):
+    global renderer
+    with profiling.profile.span("plot"):
+        if renderer is None:
+            # Imported here so that detection alone doesn't need matplotlib
+            from render import TrialRenderer
+            renderer = TrialRenderer(png)
+        renderer.render(
+            f"trial{tid}.png",
+            xs,
+            ys,
+            fixations["start"],
+            fixations["end"],
+            fixations["x"],
+            fixations["y"],
+        )
+
+
+def process_trial(
+    tid: str, times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    if args.get("profile_trials"):
+        os.makedirs(args["profile_trials"], exist_ok=True)
+        path = os.path.join(args["profile_trials"], f"trial{tid}")
+        return profiling.capture(
+            path, args["profiler"], detect_and_plot, tid, times, xs, ys, args
+        )
+    return detect_and_plot(tid, times, xs, ys, args)
+
+
+def detect_and_plot(
+    tid: str, times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> np.ndarray:
+    fixations = detect_fixations(times, xs, ys, args)
+    plot_trial(tid, xs, ys, fixations, args["png"])
+    return fixations
+
+
+def share_trial(times: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> SharedMemory:
+    """
+    Copy a trial into a new shared memory block so that a worker process can
+    read it without pickling the arrays.
+    """
+    block = SharedMemory(create=True, size=max(1, 24 * len(times)))
+    for view, column in zip(shared_trial_views(block, len(times)), (times, xs, ys)):
+        view[:] = column
+    return block
+
+
+def shared_trial_views(
+    block: SharedMemory, n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return (
+        np.ndarray(n, np.int64, block.buf, 0),
+        np.ndarray(n, np.float64, block.buf, 8 * n),
+        np.ndarray(n, np.float64, block.buf, 16 * n),
+    )
+
+
+def process_shared_trial(
+    tid: str, name: str, n: int, args: dict
+) -> Tuple[np.ndarray, Optional[dict]]:
+    # Worker processes can exit without waiting for background writes
+    if args["png"] == "async":
+        args = {**args, "png": "sync"}
+    if args.get("profile"):
+        # Every task reports its own numbers back to the main process
+        profiling.profile = profiling.Profile()
+    block = SharedMemory(name=name)
+    try:
+        fixations = process_trial(tid, *shared_trial_views(block, n), args)
+    finally:
+        block.close()
+    return fixations, profiling.profile.report() if args.get("profile") else None
+
+
+def process_trials(
+    trials: Iterable[TrialArrays], args: dict, jobs: int = 1
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Detect and plot the fixations of every trial, using a pool of jobs worker
+    processes if jobs > 1. Results are yielded in the order of the trials.
+    """
+    if jobs <= 1:
+        for tid, times, xs, ys in trials:
+            yield tid, process_trial(tid, times, xs, ys, args)
+        return
+
+    pending = deque()  # (trial id, shared memory block, future) in submission order
+    with ProcessPoolExecutor(jobs) as executor:
+        try:
+            for tid, times, xs, ys in trials:
+                block = share_trial(times, xs, ys)
+                future = executor.submit(
+                    process_shared_trial, tid, block.name, len(times), args
+                )
+                pending.append((tid, block, future))
+                # Don't read further ahead than the workers can keep up with
+                while len(pending) > 2 * jobs:
+                    yield finish_shared_trial(*pending.popleft())
+            while pending:
+                yield finish_shared_trial(*pending.popleft())
+        finally:
+            for tid, block, future in pending:
+                future.cancel()
+                block.close()
+                block.unlink()
+
+
+def finish_shared_trial(
+    tid: str, block: SharedMemory, future: Future
+) -> Tuple[str, np.ndarray]:
+    try:
+        fixations, report = future.result()
+        if report is not None:
+            profiling.profile.merge(report)
+        return tid, fixations
+    finally:
+        block.close()
+        block.unlink()
+
+
+def stream_fixations(
+    file: TextIO, eye: str, args: dict
+) -> Iterator[Tuple[str, Fixation]]:
+    """
+    Detect fixations while the samples are read and yield each one, with its
+    trial id, as soon as it is complete. Memory is bounded by the detection
+    window, not by the length of a trial.
+    """
+    import online
+
+    if args["mode"] == "dispersion":
+        detector = online.DispersionDetector(args["threshold"], 0.2 / args["freq"])
+    else:
+        detector = online.VelocityDetector(args["threshold"], 1000 / args["freq"])
+
+    reader = csv.DictReader(file)
+    x, y = eye_columns(eye)
+    current_trial_id = None
+    read = missing = 0
+    for row in reader:
+        read += 1
+        # Skip missing data points
+        if not row[x] or not row[y]:
+            missing += 1
+            continue
+        if row["trialId"] != current_trial_id:
+            count_samples(read, missing)
+            read = missing = 0
+            for fixation in detector.finish():
+                profiling.profile.count("fixations")
+                yield current_trial_id, fixation
+            current_trial_id = row["trialId"]
+        for fixation in detector.push((int(row["time"]), float(row[x]), float(row[y]))):
+            profiling.profile.count("fixations")
+            yield current_trial_id, fixation
+    count_samples(read, missing)
+    for fixation in detector.finish():
+        profiling.profile.count("fixations")
+        yield current_trial_id, fixation
+
+
+def write_fixation_events(
+    events: Iterable[Tuple[str, Fixation]], file: TextIO, format: str
+):
+    """
+    Write fixations as CSV rows or JSON lines, flushing after every line so
+    that the output can be piped into other tools.
+    """
+    if format == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(["trialId", "start_time", "end_time", "x", "y"])
+        file.flush()
+    for tid, (start_time, end_time, x, y) in events:
+        if format == "csv":
+            writer.writerow([tid, start_time, end_time, x, y])
+        else:
+            fields = ["trialId", "start_time", "end_time", "x", "y"]
+            record = dict(zip(fields, (tid, start_time, end_time, x, y)))
+            file.write(json.dumps(record) + "\n")
+        file.flush()
+
+
+def open_trials(
+    args: dict, report: Optional[csv.DictWriter] = None
+) -> Iterator[TrialArrays]:
+    """
+    Read trials from the --input file (through the --cache if given) or from
+    stdin. With --preprocess, the trials go through the quality stage first
+    and its rows go to report.
+    """
+    if args.get("preprocess"):
+        import quality
+        return quality.corrected_trials(
+            quality.open_samples(args), args["eye"], args, report
+        )
+    elif args["cache"]:
+        import cache
+        return cache.cached_trial_arrays(args["input"], args["eye"], args["cache"])
+    elif args["input"]:
+        return read_trial_arrays(
+            open(args["input"], encoding="utf8", newline=""), args["eye"]
+        )
+    else:
+        return read_trial_arrays(sys.stdin, args["eye"])
 
 
 def read_parameters():
     parser = argparse.ArgumentParser(description='Apply dispersion or velocity-based algorithms to a eyegaze dataset and visualize results.')
-    parser.add_argument("--mode", default="dispersion", choices=["dispersion", "velocity"], help="Algorithm used for detection.")
+    import detectors
+    import quality
+    import render
+
+    parser.add_argument(
+        "--mode",
+        default="dispersion",
+        choices=list(detectors.DETECTORS),
+        help="Algorithm used for detection: "
+        + "; ".join(
+            f"{name}: {detector.description}"
+            for name, detector in detectors.DETECTORS.items()
+        ),
+    )
     parser.add_argument("--freq", type=int, required=True, help="Sampling frequency of given dataset. Required for velocity-based algorithm.")
-    parser.add_argument("--threshold", type=float, required=True, help="Dispersion threshold for dispersion-based mode. Maximum velocity threshold to differenciate saccades from fixations for velocity-based mode.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help=(
+            "Dispersion threshold for dispersion-based mode. Maximum velocity threshold"
+            " to differenciate saccades from fixations for velocity-based mode."
+        ),
+    )
     parser.add_argument("--eye", default="right", choices=["left", "right"], help="Which eye should be tracked and visualized?")
+    parser.add_argument("--input", help="CSV file to read instead of stdin.")
+    parser.add_argument(
+        "--png",
+        default="sync",
+        choices=render.PNG_MODES,
+        help=(
+            "Write the trial plots synchronously, in a background thread (only without"
+            " --jobs) or not at all."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        choices=["csv", "json"],
+        help=(
+            "Don't plot, but write fixations to stdout as CSV or JSON lines while the"
+            " data is read."
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes for detection and plotting.",
+    )
+    parser.add_argument(
+        "--cache",
+        help=(
+            "Directory for a binary cache of the parsed --input file, reused by later"
+            " runs."
+        ),
+    )
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help=(
+            "Interpolate short gaps, correct the offset from the fixation cross and"
+            " drop rejected trials before detection (see quality.py)."
+        ),
+    )
+    parser.add_argument(
+        "--quality",
+        help=(
+            "Write the data quality of every trial as TSV to this file (implies"
+            " --preprocess)."
+        ),
+    )
+    quality.add_arguments(parser.add_argument_group("quality stage"))
+    parser.add_argument(
+        "--profile",
+        default=profiling.environment_path(),
+        help=(
+            "Write timings per stage and counters as JSON to this file ('-' for"
+            f" stderr). Defaults to ${profiling.ENVIRONMENT_VARIABLE}."
+        ),
+    )
+    parser.add_argument(
+        "--profile-trials",
+        help=(
+            "Run every trial under a profiler and write one report per trial to this"
+            " directory."
+        ),
+    )
+    parser.add_argument(
+        "--profiler",
+        default="cprofile",
+        choices=profiling.PROFILERS,
+        help="Profiler for --profile-trials (pyinstrument must be installed).",
+    )
 
-    return vars(parser.parse_args())
+    args = parser.parse_args()
+    if args.threshold is None and detectors.DETECTORS[args.mode].needs_threshold:
+        parser.error(f"--mode {args.mode} needs a --threshold")
+    if args.quality:
+        args.preprocess = True
+    if args.stream and args.preprocess:
+        parser.error("--stream can't be combined with --preprocess")
+    if args.stream and args.mode not in ("dispersion", "velocity"):
+        parser.error("--stream only supports the dispersion and velocity modes")
+    if args.cache and not args.input:
+        parser.error("--cache needs an --input file")
+    if args.profile_trials and not profiling.available(args.profiler):
+        parser.error(f"--profiler {args.profiler} is not installed")
+    return vars(args)
 
 if __name__ == "__main__":
     args = read_parameters()
+    if args["profile"]:
+        profiling.enable()
 
-    trials = read_trials(sys.stdin, args["eye"])
-    for tid, trial in trials:
-        fig, ax = plt.subplots()
-        ax.invert_yaxis()
-
-        xs = [x for time, x, y in trial]
-        ys = [y for time, x, y in trial]
-        ax.plot(xs, ys, color="red")
-
-        if args["mode"] == "dispersion":
-            fixations = list(dispersion_based_fixations(trial, args["threshold"], 0.2 / args["freq"]))
-        elif args["mode"] == "velocity":
-            # NOTE: The maximum velocity parameter is highly dependent on the sampling frequency (as mentioned in the paper)
-            try:
-                fixations = list(velocity_based_fixations(trial, args["threshold"], 1000 / args["freq"]))
-            except TypeError as e:
-                # print(e)
-                print("Velocity-based mode needs optional arguments 'threshold' and 'freq'! See --help for more.")
-                exit()
-        else:
-            mode = args["mode"]
-            print(f"Detection mode {mode} not recognized.")
-
-        xs = [x for start_time, end_time, x, y in fixations]
-        ys = [y for start_time, end_time, x, y in fixations]
-        ax.plot(xs, ys, color="blue")
-        for start_time, end_time, x, y in fixations:
-            c = plt.Circle((x, y), radius=(end_time - start_time) / 100, color="blue")
-            ax.add_patch(c)
-        plt.savefig(f"trial{tid}.png")
+    if args["stream"]:
+        file = (
+            open(args["input"], encoding="utf8", newline="")
+            if args["input"]
+            else sys.stdin
+        )
+        try:
+            with profiling.profile.span("stream"):
+                write_fixation_events(
+                    stream_fixations(file, args["eye"], args),
+                    sys.stdout,
+                    args["stream"],
+                )
+        except BrokenPipeError:
+            # The next tool in the pipe stopped reading (e.g. head)
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    else:
+        report_file = None
+        report = None
+        if args["quality"]:
+            import quality
+            report_file = open(args["quality"], "w", encoding="utf8", newline="")
+            report = csv.DictWriter(
+                report_file,
+                quality.QUALITY_COLUMNS,
+                delimiter="\t",
+                lineterminator="\n",
+            )
+            report.writeheader()
+        with profiling.profile.span("total"):
+            trials = profiling.profile.iterate("read", open_trials(args, report))
+            for tid, fixations in process_trials(trials, args, args["jobs"]):
+                pass
+            if renderer is not None:
+                with profiling.profile.span("plot.close"):
+                    renderer.close()
+        if report_file is not None:
+            report_file.close()
+
+    if args["profile"]:
+        profiling.profile.dump(args["profile"])
@@ -0,0 +1,389 @@
+"""
+Parser and index for the logs written by experiment/experiment.py.
+
+A directory of logs is parsed once into a dataset directory of NumPy
+columns: one row per fixation (sorted by participant and trial) and one row
+per trial with the offset of its fixations, its stimulus and the area of
+interest from the tracker messages. Later analyses memory-map the columns
+and slice the fixations of a participant or trial directly, instead of
+reading the text logs again. The dataset is rebuilt when a log changes.
+
+Understood files (participant ids are taken from the last number in the file
+name):
+- participant logs, with a fixation_x/fixation_y or (older, as in
+  experiment/results/example_log.txt) a fixation_pos column
+- the stimulus lookup files written next to them (*_stimuli.txt)
+- any other text file with "start_trial"/"end_trial" tracker messages
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from cache import write_json
+
+
+DATASET_VERSION = 1
+FIXATION_COLUMNS = {
+    "participant": np.int32,
+    "trialnr": np.int32,
+    "time": "datetime64[us]",
+    "fixation_start": np.float64,
+    "fixation_x": np.float32,
+    "fixation_y": np.float32,
+    "within_aoi": bool,
+    "word": np.int32,
+}
+TRIAL_COLUMNS = {
+    "participant": np.int32,
+    "trialnr": np.int32,
+    "offset": np.int64,
+    "count": np.int64,
+    "stimulus": np.int32,
+    "aoi_x": np.float64,
+    "aoi_y": np.float64,
+    "aoi_w": np.float64,
+    "aoi_h": np.float64,
+    "start_time": np.float64,
+    "end_time": np.float64,
+}
+
+START_TRIAL = re.compile(
+    r"start_trial (\d+) stimulus '(.*?)'"
+    r"(?: aoi x=([^,]+),y=([^,]+),w=([^,]+),h=(\S+))?\s*$"
+)
+END_TRIAL = re.compile(r"end_trial (\d+)\s*$")
+# Timestamp in front of a message, e.g. "MSG\t1234.5\tstart_trial ..."
+TIMESTAMP = re.compile(r"(\d+(?:\.\d+)?)\D*$")
+
+
+def participant_name(path: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    numbers = re.findall(r"\d+", stem.replace("_stimuli", ""))
+    return str(int(numbers[-1])) if numbers else stem
+
+
+def participant_sort_key(name: str):
+    # Numbered participants first, in numeric order
+    return (0, int(name), name) if name.isdigit() else (1, 0, name)
+
+
+def read_text(path: str) -> str:
+    # Older logs were written in the platform encoding
+    with open(path, "rb") as file:
+        data = file.read()
+    try:
+        return data.decode("utf8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def split_columns(text: str) -> Dict[str, List[str]]:
+    """
+    Split a tab-separated text with a header into its columns.
+    """
+    lines = text.replace("\r\n", "\n").rstrip("\n").split("\n")
+    header = lines[0].split("\t")
+    rows = [line.split("\t") for line in lines[1:] if line]
+    if not rows:
+        return {name: [] for name in header}
+    return dict(zip(header, map(list, zip(*rows))))
+
+
+def parse_participant_log(text: str) -> Tuple[Dict[str, np.ndarray], Dict[int, str]]:
+    """
+    Fixation columns of a participant log, and the stimuli per trial if the
+    log has them on every row (older format).
+    """
+    columns = split_columns(text)
+    n = len(columns["trialnr"])
+    fixations = {
+        "trialnr": np.array(columns["trialnr"], dtype=np.int32),
+        "time": np.array(columns["time"], dtype="datetime64[us]"),
+        "fixation_start": np.array(columns["fixation_start"], dtype=np.float64),
+        "within_aoi": np.array(columns["within_aoi"]) == "True",
+    }
+    if "fixation_pos" in columns:
+        # tuple repr, e.g. "(257.0, 548.0)"
+        pos = ",".join(columns["fixation_pos"]).replace("(", "").replace(")", "")
+        pos = np.array(pos.split(",") if n else [], dtype=np.float32).reshape(n, 2)
+        fixations["fixation_x"] = pos[:, 0]
+        fixations["fixation_y"] = pos[:, 1]
+    else:
+        fixations["fixation_x"] = np.array(columns["fixation_x"], dtype=np.float32)
+        fixations["fixation_y"] = np.array(columns["fixation_y"], dtype=np.float32)
+    if "word" in columns:
+        fixations["word"] = np.array(columns["word"], dtype=np.int32)
+    else:
+        fixations["word"] = np.full(n, -1, dtype=np.int32)
+
+    stimuli = {}
+    if "stimulus" in columns:
+        stimuli = dict(zip(fixations["trialnr"].tolist(), columns["stimulus"]))
+    return fixations, stimuli
+
+
+def parse_stimulus_log(text: str) -> Dict[int, str]:
+    columns = split_columns(text)
+    return dict(zip(map(int, columns["trialnr"]), columns["stimulus"]))
+
+
+def parse_tracker_log(text: str) -> Dict[int, dict]:
+    """
+    Stimulus, area of interest and start/end times of every trial from the
+    start_trial and end_trial messages.
+    """
+    trials = {}
+    for line in text.splitlines():
+        if "_trial " not in line:
+            continue
+        start = START_TRIAL.search(line)
+        end = END_TRIAL.search(line) if start is None else None
+        if start is None and end is None:
+            continue
+        match = start or end
+        timestamp = TIMESTAMP.search(line[: match.start()])
+        time = float(timestamp.group(1)) if timestamp else np.nan
+        trial = trials.setdefault(int(match.group(1)), {})
+        if start is not None:
+            trial["stimulus"] = start.group(2)
+            trial["start_time"] = time
+            if start.group(3) is not None:
+                for key, value in zip(
+                    ("aoi_x", "aoi_y", "aoi_w", "aoi_h"), start.groups()[2:]
+                ):
+                    trial[key] = float(value)
+        else:
+            trial["end_time"] = time
+    return trials
+
+
+def log_files(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name))
+        and name.endswith((".txt", ".tsv", ".log", ".asc"))
+    )
+
+
+def file_stats(paths: List[str]) -> Dict[str, list]:
+    stats = {}
+    for path in paths:
+        stat = os.stat(path)
+        stats[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def build_dataset(directory: str, output: str):
+    """
+    Parse all logs in directory and write the dataset to output.
+    """
+    fixation_parts = {}
+    stimuli = {}
+    tracker_trials = {}
+    paths = log_files(directory)
+    for path in paths:
+        text = read_text(path)
+        participant = participant_name(path)
+        header = text.split("\n", 1)[0].split("\t")
+        if header[:2] == ["time", "trialnr"]:
+            fixations, row_stimuli = parse_participant_log(text)
+            fixation_parts[participant] = fixations
+            stimuli.setdefault(participant, {}).update(row_stimuli)
+        elif header == ["trialnr", "stimulus"]:
+            stimuli.setdefault(participant, {}).update(parse_stimulus_log(text))
+        elif "start_trial" in text:
+            tracker_trials.setdefault(participant, {}).update(parse_tracker_log(text))
+
+    participants = sorted(
+        set(fixation_parts) | set(stimuli) | set(tracker_trials),
+        key=participant_sort_key,
+    )
+    stimulus_texts = {}
+    fixation_columns = {name: [] for name in FIXATION_COLUMNS}
+    trial_columns = {name: [] for name in TRIAL_COLUMNS}
+    participant_offsets = [0]
+    offset = 0
+    for code, participant in enumerate(participants):
+        fixations = fixation_parts.get(participant)
+        if fixations is None:
+            fixations = {
+                name: np.zeros(0, dtype) for name, dtype in FIXATION_COLUMNS.items()
+            }
+        order = np.argsort(fixations["trialnr"], kind="stable")
+        fixations = {name: column[order] for name, column in fixations.items()}
+        fixations["participant"] = np.full(len(order), code, dtype=np.int32)
+        for name in FIXATION_COLUMNS:
+            fixation_columns[name].append(fixations[name])
+
+        messages = tracker_trials.get(participant, {})
+        trial_stimuli = stimuli.get(participant, {})
+        trialnrs = np.unique(
+            np.concatenate(
+                [fixations["trialnr"], list(trial_stimuli), list(messages)]
+            ).astype(np.int32)
+        )
+        bounds = np.searchsorted(
+            fixations["trialnr"], np.append(trialnrs, np.iinfo(np.int32).max)
+        )
+        for trialnr, start, end in zip(
+            trialnrs.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()
+        ):
+            message = messages.get(trialnr, {})
+            text = trial_stimuli.get(trialnr, message.get("stimulus"))
+            trial_columns["participant"].append(code)
+            trial_columns["trialnr"].append(trialnr)
+            trial_columns["offset"].append(offset + start)
+            trial_columns["count"].append(end - start)
+            trial_columns["stimulus"].append(
+                -1
+                if text is None
+                else stimulus_texts.setdefault(text, len(stimulus_texts))
+            )
+            for name in ("aoi_x", "aoi_y", "aoi_w", "aoi_h", "start_time", "end_time"):
+                trial_columns[name].append(message.get(name, np.nan))
+        offset += len(order)
+        participant_offsets.append(len(trial_columns["trialnr"]))
+
+    temporary = f"{output}.{os.getpid()}.tmp"
+    os.makedirs(temporary, exist_ok=True)
+    for name, dtype in FIXATION_COLUMNS.items():
+        parts = fixation_columns[name]
+        column = np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype)
+        np.save(os.path.join(temporary, f"fixation_{name}.npy"), column)
+    for name, dtype in TRIAL_COLUMNS.items():
+        np.save(
+            os.path.join(temporary, f"trial_{name}.npy"),
+            np.array(trial_columns[name], dtype=dtype),
+        )
+    np.save(
+        os.path.join(temporary, "participant_offsets.npy"),
+        np.array(participant_offsets, np.int64),
+    )
+    write_json(
+        os.path.join(temporary, "meta.json"),
+        {
+            "version": DATASET_VERSION,
+            "sources": file_stats(paths),
+            "participants": participants,
+            "stimuli": list(stimulus_texts),
+            "fixations": offset,
+        },
+    )
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(temporary, output)
+
+
+def dataset_is_current(directory: str, output: str) -> bool:
+    try:
+        with open(os.path.join(output, "meta.json"), encoding="utf8") as file:
+            meta = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    sources = file_stats(log_files(directory))
+    return meta.get("version") == DATASET_VERSION and meta.get("sources") == sources
+
+
+class LogDataset:
+    """
+    Memory-mapped view of a dataset written by build_dataset().
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), encoding="utf8") as file:
+            meta = json.load(file)
+        self.participants: List[str] = meta["participants"]
+        self.stimuli: List[str] = meta["stimuli"]
+        self.fixations = {
+            name: np.load(os.path.join(path, f"fixation_{name}.npy"), mmap_mode="r")
+            for name in FIXATION_COLUMNS
+        }
+        self.trials = {
+            name: np.load(os.path.join(path, f"trial_{name}.npy"), mmap_mode="r")
+            for name in TRIAL_COLUMNS
+        }
+        self.participant_offsets = np.load(
+            os.path.join(path, "participant_offsets.npy")
+        )
+
+    def trial_rows(self, participant: str) -> slice:
+        """
+        Rows of the participant in self.trials.
+        """
+        code = self.participants.index(str(participant))
+        return slice(
+            int(self.participant_offsets[code]), int(self.participant_offsets[code + 1])
+        )
+
+    def participant_fixations(self, participant: str) -> Dict[str, np.ndarray]:
+        rows = self.trial_rows(participant)
+        if rows.start == rows.stop:
+            return {name: column[:0] for name, column in self.fixations.items()}
+        start = int(self.trials["offset"][rows.start])
+        end = int(
+            self.trials["offset"][rows.stop - 1] + self.trials["count"][rows.stop - 1]
+        )
+        return {name: column[start:end] for name, column in self.fixations.items()}
+
+    def trial(self, participant: str, trialnr: int) -> dict:
+        """
+        Trial information (stimulus text, AOI, times) and fixation columns
+        of one trial.
+        """
+        rows = self.trial_rows(participant)
+        trialnrs = self.trials["trialnr"][rows]
+        row = rows.start + int(np.searchsorted(trialnrs, trialnr))
+        if row >= rows.stop or self.trials["trialnr"][row] != trialnr:
+            raise KeyError(f"participant {participant} has no trial {trialnr}")
+        info = {name: column[row].item() for name, column in self.trials.items()}
+        info["stimulus"] = (
+            self.stimuli[info["stimulus"]] if info["stimulus"] >= 0 else None
+        )
+        start = info["offset"]
+        end = start + info["count"]
+        info["fixations"] = {
+            name: column[start:end] for name, column in self.fixations.items()
+        }
+        return info
+
+
+def open_dataset(directory: str, output: str) -> LogDataset:
+    """
+    Dataset of the logs in directory, stored in output. It is (re)built if
+    it doesn't exist yet or a log was added, removed or changed.
+    """
+    if not dataset_is_current(directory, output):
+        build_dataset(directory, output)
+    return LogDataset(output)
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Parse a directory of experiment logs and tracker messages into an indexed,"
+            " memory-mappable dataset."
+        )
+    )
+    parser.add_argument(
+        "logs", help="Directory with the participant logs and tracker logs."
+    )
+    parser.add_argument("--output", required=True, help="Directory for the dataset.")
+    return vars(parser.parse_args())
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    dataset = open_dataset(args["logs"], args["output"])
+    print(
+        f"{len(dataset.participants)} participants, {len(dataset.trials['trialnr'])}"
+        f" trials, {len(dataset.fixations['trialnr'])} fixations",
+        file=sys.stderr,
+    )
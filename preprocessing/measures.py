@@ -0,0 +1,284 @@
+"""
+Reading measures per trial and region of interest (ROI), in the format
+linear_modeling/Assignment_4_Frequentist_Data_Analysis.r reads.
+
+FPRT  first-pass reading time: summed duration of the fixations on the ROI
+      from entering it for the first time until leaving it, 0 if the ROI
+      was skipped (a later ROI was fixated first) or never fixated
+TFT   total fixation time: summed duration of all fixations on the ROI
+FPR   first-pass regression: 1 if the first pass ended with a fixation on an
+      earlier ROI
+RPD   regression-path duration (go-past time): summed duration of all
+      fixations from entering the ROI in first pass until a later ROI is
+      fixated, 0 if there is no first pass
+
+All measures are computed for all trials at once with array operations on
+runs of consecutive fixations on the same ROI.
+"""
+
+import argparse
+import csv
+import sys
+from typing import Dict, NamedTuple, TextIO
+
+import numpy as np
+
+
+MEASURES = ["FPRT", "TFT", "FPR", "RPD"]
+TRIAL_COLUMNS = ["subj", "item", "cond"]
+
+
+class Measures(NamedTuple):
+    """
+    Measures of every (trial, roi) pair that was fixated, sorted by trial
+    and roi.
+    """
+    trials: np.ndarray
+    rois: np.ndarray
+    FPRT: np.ndarray
+    TFT: np.ndarray
+    FPR: np.ndarray
+    RPD: np.ndarray
+
+
+def reading_measures(
+    trials: np.ndarray, rois: np.ndarray, durations: np.ndarray
+) -> Measures:
+    """
+    trials (non-negative trial codes), rois (non-negative ROI indices in
+    reading order) and durations describe one fixation each. The fixations
+    of a trial must be contiguous and in temporal order, and the trial codes
+    ascending.
+    """
+    trials = np.asarray(trials, dtype=np.int64)
+    rois = np.asarray(rois, dtype=np.int64)
+    durations = np.asarray(durations)
+    if len(trials) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return Measures(empty, empty, empty, empty, empty, empty)
+
+    # One key per (trial, roi); keys increase with the trial code
+    stride = int(rois.max()) + 1
+    keys = trials * stride + rois
+
+    # Runs of consecutive fixations on the same ROI of the same trial
+    run_starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    run_keys = keys[run_starts]
+    run_trials = trials[run_starts]
+    run_durations = np.add.reduceat(durations, run_starts)
+    # Key of the rightmost ROI reached so far (in the same trial)
+    reached = np.maximum.accumulate(run_keys)
+    reached_before = np.append(-1, reached[:-1])
+
+    pair_keys, first_runs, pair_index = np.unique(
+        run_keys, return_index=True, return_inverse=True
+    )
+    tft = np.bincount(pair_index, weights=run_durations)
+
+    # First pass: the ROI is entered before any ROI to its right
+    first_pass = reached_before[first_runs] < pair_keys
+    fprt = np.where(first_pass, run_durations[first_runs], 0)
+
+    next_runs = np.minimum(first_runs + 1, len(run_keys) - 1)
+    regression = (
+        (first_runs + 1 < len(run_keys))
+        & (run_trials[next_runs] == run_trials[first_runs])
+        & (run_keys[next_runs] < pair_keys)
+    )
+    fpr = (first_pass & regression).astype(np.int64)
+
+    # The regression path ends with the first run that reaches further right
+    path_ends = np.searchsorted(reached, pair_keys, side="right")
+    elapsed = np.concatenate(([0], np.cumsum(run_durations)))
+    rpd = np.where(first_pass, elapsed[path_ends] - elapsed[first_runs], 0)
+
+    return Measures(
+        pair_keys // stride,
+        pair_keys % stride,
+        fprt,
+        tft.astype(run_durations.dtype),
+        fpr,
+        rpd,
+    )
+
+
+def read_table(file: TextIO) -> Dict[str, np.ndarray]:
+    """
+    Read a tab-separated file with a header into one array per column.
+    """
+    reader = csv.reader(file, delimiter="\t")
+    header = next(reader)
+    rows = [row for row in reader if row]
+    if not rows:
+        return {name: np.zeros(0, dtype=str) for name in header}
+    return {name: np.array(column) for name, column in zip(header, zip(*rows))}
+
+
+def assign_rois(
+    fixations: Dict[str, np.ndarray], aois: Dict[str, np.ndarray]
+) -> np.ndarray:
+    """
+    ROI of every fixation from rectangular AOIs (columns item, roi, x, y, w
+    and h, with x and y the top left corner). Fixations outside of all AOIs
+    of their item get -1.
+    """
+    xs = fixations["x"].astype(float)
+    ys = fixations["y"].astype(float)
+    rois = np.full(len(xs), -1, dtype=np.int64)
+    aoi_items = aois["item"]
+    left = aois["x"].astype(float)
+    top = aois["y"].astype(float)
+    right = left + aois["w"].astype(float)
+    bottom = top + aois["h"].astype(float)
+    aoi_rois = aois["roi"].astype(np.int64)
+
+    for item in np.unique(aoi_items):
+        rows = np.flatnonzero(fixations["item"] == item)
+        regions = np.flatnonzero(aoi_items == item)
+        x = xs[rows, None]
+        y = ys[rows, None]
+        inside = (
+            (x >= left[regions])
+            & (x < right[regions])
+            & (y >= top[regions])
+            & (y < bottom[regions])
+        )
+        hit = inside.any(axis=1)
+        rois[rows[hit]] = aoi_rois[regions[inside[hit].argmax(axis=1)]]
+    return rois
+
+
+def measure_table(
+    fixations: Dict[str, np.ndarray], aois: Dict[str, np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Reading measures for every trial and every ROI of its item, including
+    ROIs that were never fixated (with all measures 0).
+
+    fixations needs the columns subj, item, cond, start and end, and either
+    roi or x and y (with aois). An optional trial column tells apart
+    repeated presentations of an item to the same subject.
+    """
+    if "roi" in fixations:
+        rois = np.where(
+            np.isin(fixations["roi"], ["", "NA"]), "-1", fixations["roi"]
+        ).astype(np.int64)
+    else:
+        rois = assign_rois(fixations, aois)
+    durations = fixations["end"].astype(float) - fixations["start"].astype(float)
+    if np.all(durations == np.round(durations)):
+        durations = durations.astype(np.int64)
+
+    trial_columns = TRIAL_COLUMNS + (["trial"] if "trial" in fixations else [])
+    # Number the trials by combining the codes of the label columns
+    values, codes = zip(
+        *(np.unique(fixations[column], return_inverse=True) for column in trial_columns)
+    )
+    combined = np.zeros(len(rois), dtype=np.int64)
+    for column_values, column_codes in zip(values, codes):
+        combined = combined * len(column_values) + column_codes.reshape(-1)
+    trial_keys, first_fixations, trials = np.unique(
+        combined, return_index=True, return_inverse=True
+    )
+    trials = trials.reshape(-1)
+    labels = np.column_stack(
+        [fixations[column][first_fixations] for column in trial_columns]
+    )
+
+    # Fixations outside of the ROIs don't count for any measure
+    order = np.lexsort((fixations["start"].astype(float), trials))
+    order = order[rois[order] >= 0]
+    measures = reading_measures(trials[order], rois[order], durations[order])
+
+    # ROIs of every item: the AOIs if given, otherwise all fixated ones
+    items, item_codes = np.unique(labels[:, 1], return_inverse=True)
+    if aois is not None:
+        aoi_items = np.searchsorted(items, aois["item"])
+        known = (aoi_items < len(items)) & (
+            items[np.minimum(aoi_items, len(items) - 1)] == aois["item"]
+        )
+        item_rois = np.unique(
+            np.column_stack([aoi_items[known], aois["roi"][known].astype(np.int64)]),
+            axis=0,
+        )
+    else:
+        item_rois = np.unique(
+            np.column_stack([item_codes[measures.trials], measures.rois]), axis=0
+        )
+    item_rois = item_rois.reshape(-1, 2)
+    item_bounds = np.searchsorted(item_rois[:, 0], np.arange(len(items) + 1))
+
+    # One row per trial and ROI of the trial's item
+    counts = np.diff(item_bounds)[item_codes]
+    row_trials = np.repeat(np.arange(len(labels)), counts)
+    first_rows = np.repeat(np.cumsum(counts) - counts, counts)
+    pair_rows = (
+        np.repeat(item_bounds[:-1][item_codes], counts)
+        + np.arange(len(row_trials))
+        - first_rows
+    )
+    row_rois = item_rois[pair_rows, 1]
+
+    table = {column: labels[row_trials, i] for i, column in enumerate(trial_columns)}
+    table["roi"] = row_rois
+    # Both are sorted by (trial, roi), so the fixated pairs are a lookup
+    stride = max(row_rois.max(initial=0), measures.rois.max(initial=0)) + 1
+    row_keys = row_trials * stride + row_rois
+    measure_keys = measures.trials * stride + measures.rois
+    found = np.searchsorted(measure_keys, row_keys)
+    fixated = found < len(measure_keys)
+    fixated[fixated] = measure_keys[found[fixated]] == row_keys[fixated]
+    for name in MEASURES:
+        values = getattr(measures, name)
+        column = np.zeros(len(row_keys), dtype=values.dtype)
+        column[fixated] = values[found[fixated]]
+        table[name] = column
+    return table
+
+
+def write_table(table: Dict[str, np.ndarray], file: TextIO):
+    writer = csv.writer(file, delimiter="\t", lineterminator="\n")
+    writer.writerow(list(table))
+    writer.writerows(zip(*(column.tolist() for column in table.values())))
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compute first-pass reading times, total fixation times, first-pass"
+            " regressions and regression-path durations per trial and region of"
+            " interest."
+        )
+    )
+    parser.add_argument(
+        "--input",
+        help=(
+            "Tab-separated fixations (subj, item, cond, start, end, and roi or x and y)"
+            " to read instead of stdin."
+        ),
+    )
+    parser.add_argument(
+        "--aois",
+        help=(
+            "Tab-separated rectangular regions of interest (item, roi, x, y, w, h) to"
+            " assign the fixations by position."
+        ),
+    )
+    return vars(parser.parse_args())
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    with (
+        open(args["input"], encoding="utf8", newline="") if args["input"] else sys.stdin
+    ) as file:
+        fixations = read_table(file)
+    aois = None
+    if args["aois"]:
+        with open(args["aois"], encoding="utf8", newline="") as file:
+            aois = read_table(file)
+    if "roi" not in fixations and aois is None:
+        sys.exit("The fixations have no roi column, so --aois is needed")
+
+    write_table(measure_table(fixations, aois), sys.stdout)
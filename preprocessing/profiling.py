@@ -0,0 +1,156 @@
+"""
+Optional instrumentation of the fixation pipeline.
+
+Stages are timed with named spans and events are tallied with counters.
+Both go to the module-level `profile`, which does nothing until enable() is
+called (by --profile or the FIXATIONS_PROFILE environment variable), so the
+hooks cost a function call per trial when profiling is off. The collected
+numbers are dumped as JSON.
+
+capture() runs a single call under cProfile or pyinstrument (optional
+dependency), for a per-trial view of where the time goes.
+"""
+
+import cProfile
+import importlib.util
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterable, Iterator, Optional
+
+ENVIRONMENT_VARIABLE = "FIXATIONS_PROFILE"
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+class Profile:
+    def __init__(self):
+        self.spans = {}  # name -> [calls, seconds]
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name: str, seconds: float, calls: int = 1):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += calls
+        span[1] += seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def iterate(self, name: str, items: Iterable) -> Iterator:
+        """
+        Yield from items, timing the production of each item (e.g. the
+        reading and parsing of a trial) in the span name.
+        """
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_span(name, time.perf_counter() - start, calls=0)
+                return
+            self.add_span(name, time.perf_counter() - start)
+            yield item
+
+    def merge(self, report: dict):
+        """
+        Add the numbers of another profile's report(), e.g. from a worker
+        process.
+        """
+        for name, span in report["spans"].items():
+            self.add_span(name, span["seconds"], span["calls"])
+        for name, n in report["counters"].items():
+            self.count(name, n)
+
+    def report(self) -> dict:
+        return {
+            "spans": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.spans.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def dump(self, path: str):
+        """
+        Write the report as JSON to path ("-" for stderr).
+        """
+        if path == "-":
+            json.dump(self.report(), sys.stderr, indent=1)
+            sys.stderr.write("\n")
+        else:
+            with open(path, "w", encoding="utf8") as file:
+                json.dump(self.report(), file, indent=1)
+
+
+class NullProfile:
+    """
+    Stand-in for Profile while profiling is disabled.
+    """
+
+    def span(self, name: str):
+        return nullcontext()
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    def iterate(self, name: str, items: Iterable) -> Iterable:
+        return items
+
+    def merge(self, report: dict):
+        pass
+
+
+profile = NullProfile()
+
+
+def enable() -> Profile:
+    global profile
+    if not isinstance(profile, Profile):
+        profile = Profile()
+    return profile
+
+
+def environment_path() -> Optional[str]:
+    """
+    Output path from the FIXATIONS_PROFILE environment variable, if set.
+    """
+    return os.environ.get(ENVIRONMENT_VARIABLE) or None
+
+
+def available(profiler: str) -> bool:
+    return profiler == "cprofile" or importlib.util.find_spec(profiler) is not None
+
+
+def capture(path: str, profiler: str, function: Callable, *args):
+    """
+    Call function(*args) under the given profiler and save what it recorded
+    to path (without extension): path.prof for cProfile (readable with
+    pstats or snakeviz), path.txt for pyinstrument.
+    """
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return function(*args)
+        finally:
+            profiler.stop()
+            with open(f"{path}.txt", "w", encoding="utf8") as file:
+                file.write(profiler.output_text())
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(f"{path}.prof")
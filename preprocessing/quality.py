@@ -0,0 +1,393 @@
+"""
+Data quality and drift correction, run on whole trials before detection.
+
+Every trial of the experiment starts with a drift correction on the fixation
+cross at constants.STIMULUS_START, where the sentence begins, so the first
+samples of a recording show where the tracker places a fixation on a known
+target. From these samples we take the offset of the trial (the median gaze
+minus the cross position) and subtract it from the whole trial; for the
+single-line stimuli the vertical offset matters most (--correct vertical).
+
+Short gaps of missing samples (up to --max-gap ms, e.g. a blink) are filled
+by linear interpolation. Per trial and eye, we report:
+
+dropout        fraction of missing samples (before interpolation)
+longest_gap    longest run of missing samples, in ms
+interpolated   number of samples filled in
+offset_x/y     median gaze minus the cross position, in pixels
+accuracy       length of that offset
+precision_rms  root mean square of the sample-to-sample distances on the cross
+precision_sd   spread (standard deviation) of the samples on the cross
+
+Trials over the --max-dropout, --max-accuracy or --max-precision limits are
+marked as rejected and left out of the corrected data.
+"""
+
+import argparse
+import csv
+import os
+import sys
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+import profiling
+from fixations import (
+    BINOCULAR_COLUMNS,
+    BinocularArrays,
+    TrialArrays,
+    read_binocular_arrays,
+)
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment")
+)
+import constants  # noqa: E402
+
+
+CROSS = constants.STIMULUS_START
+CORRECTIONS = ["both", "vertical", "none"]
+QUALITY_COLUMNS = [
+    "trialId",
+    "eye",
+    "samples",
+    "dropout",
+    "longest_gap",
+    "interpolated",
+    "offset_x",
+    "offset_y",
+    "accuracy",
+    "precision_rms",
+    "precision_sd",
+    "rejected",
+]
+
+
+def missing_runs(missing: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Start and end (exclusive) indices of the runs of missing samples.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], missing, [False]))))
+    return edges[0::2], edges[1::2]
+
+
+def run_mask(n: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    True for every index in one of the runs [start, end).
+    """
+    marks = np.zeros(n + 1, dtype=int)
+    np.add.at(marks, starts, 1)
+    np.add.at(marks, ends, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def gap_durations(
+    times: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    """
+    Time (in ms) between the last sample before and the first sample after
+    each gap; gaps at the edges of a trial are measured to the trial's edge.
+    """
+    n = len(times)
+    before = times[np.maximum(starts - 1, 0)]
+    after = times[np.minimum(ends, n - 1)]
+    return after - before
+
+
+def interpolate_gaps(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, max_gap: float
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Fill the gaps of missing (NaN) samples that last at most max_gap ms and
+    have samples on both sides by linear interpolation. Returns the new
+    coordinates and the number of samples filled in.
+    """
+    missing = np.isnan(xs) | np.isnan(ys)
+    starts, ends = missing_runs(missing)
+    inner = (starts > 0) & (ends < len(times))
+    short = inner & (gap_durations(times, starts, ends) <= max_gap)
+    fill = run_mask(len(times), starts[short], ends[short])
+    if not fill.any():
+        return xs, ys, 0
+    present = ~missing
+    xs = xs.copy()
+    ys = ys.copy()
+    xs[fill] = np.interp(times[fill], times[present], xs[present])
+    ys[fill] = np.interp(times[fill], times[present], ys[present])
+    return xs, ys, int(np.count_nonzero(fill))
+
+
+def cross_samples(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, duration: float
+) -> np.ndarray:
+    """
+    Mask of the samples recorded in the first duration ms of the trial,
+    while the participant still looks at the fixation cross.
+    """
+    return (times < times[0] + duration) & ~(np.isnan(xs) | np.isnan(ys))
+
+
+def precision(xs: np.ndarray, ys: np.ndarray) -> Tuple[float, float]:
+    """
+    RMS of the sample-to-sample distances and standard deviation of the
+    samples, both in pixels.
+    """
+    if len(xs) < 2:
+        return np.nan, np.nan
+    steps = np.hypot(np.diff(xs), np.diff(ys))
+    rms = float(np.sqrt(np.mean(steps ** 2)))
+    sd = float(np.sqrt(xs.var() + ys.var()))
+    return rms, sd
+
+
+def rejections(row: dict, args: dict) -> str:
+    """
+    Comma-separated names of the limits the trial exceeds.
+    """
+    reasons = []
+    limits = [
+        ("dropout", "max_dropout"),
+        ("accuracy", "max_accuracy"),
+        ("precision_rms", "max_precision"),
+    ]
+    for column, limit in limits:
+        # A trial without samples on the cross can't be judged by it
+        if (
+            args[limit] is not None
+            and not np.isnan(row[column])
+            and row[column] > args[limit]
+        ):
+            reasons.append(column)
+    return ",".join(reasons)
+
+
+def assess_trial(
+    times: np.ndarray, xs: np.ndarray, ys: np.ndarray, args: dict
+) -> Tuple[np.ndarray, np.ndarray, dict]:
+    """
+    Measure the quality of one eye in a trial, interpolate its short gaps and
+    correct its offset. Returns the corrected coordinates (NaN where still
+    missing) and the report values.
+    """
+    n = len(times)
+    missing = np.isnan(xs) | np.isnan(ys)
+    starts, ends = missing_runs(missing)
+    durations = gap_durations(times, starts, ends)
+
+    on_cross = cross_samples(times, xs, ys, args["cross_duration"])
+    if on_cross.any():
+        offset_x = float(np.median(xs[on_cross])) - args["cross"][0]
+        offset_y = float(np.median(ys[on_cross])) - args["cross"][1]
+    else:
+        offset_x = offset_y = np.nan
+    precision_rms, precision_sd = precision(xs[on_cross], ys[on_cross])
+
+    xs, ys, interpolated = interpolate_gaps(times, xs, ys, args["max_gap"])
+    if args["correct"] != "none" and not np.isnan(offset_y):
+        if args["correct"] == "both":
+            xs = xs - offset_x
+        ys = ys - offset_y
+
+    row = {
+        "samples": n,
+        "dropout": np.count_nonzero(missing) / n if n else np.nan,
+        "longest_gap": int(durations.max()) if len(durations) else 0,
+        "interpolated": interpolated,
+        "offset_x": offset_x,
+        "offset_y": offset_y,
+        "accuracy": float(np.hypot(offset_x, offset_y)),
+        "precision_rms": precision_rms,
+        "precision_sd": precision_sd,
+    }
+    row["rejected"] = rejections(row, args)
+    return xs, ys, row
+
+
+def format_row(row: dict) -> dict:
+    formatted = {}
+    for column, value in row.items():
+        if isinstance(value, float) and np.isnan(value):
+            value = ""
+        elif isinstance(value, float):
+            value = f"{value:.4f}" if column == "dropout" else f"{value:.2f}"
+        formatted[column] = value
+    return formatted
+
+
+def assess_binocular(
+    trials: Iterator[BinocularArrays], args: dict
+) -> Iterator[Tuple[BinocularArrays, dict, dict]]:
+    """
+    Assess both eyes of every trial. Yields the corrected trial and the
+    report rows of the left and the right eye.
+    """
+    for tid, times, x_left, y_left, x_right, y_right in trials:
+        x_left, y_left, left = assess_trial(times, x_left, y_left, args)
+        x_right, y_right, right = assess_trial(times, x_right, y_right, args)
+        left = {"trialId": tid, "eye": "left", **left}
+        right = {"trialId": tid, "eye": "right", **right}
+        yield (tid, times, x_left, y_left, x_right, y_right), left, right
+
+
+def corrected_trials(
+    trials: Iterator[BinocularArrays],
+    eye: str,
+    args: dict,
+    report: Optional[csv.DictWriter] = None,
+) -> Iterator[TrialArrays]:
+    """
+    Run the quality stage on one eye of the trials (read with keep_missing)
+    and yield the accepted trials, without their remaining missing samples,
+    for detection. If given, report gets the quality row of every trial.
+    """
+    for tid, times, x_left, y_left, x_right, y_right in trials:
+        xs, ys = (x_left, y_left) if eye == "left" else (x_right, y_right)
+        with profiling.profile.span("quality"):
+            xs, ys, row = assess_trial(times, xs, ys, args)
+        if row["rejected"]:
+            profiling.profile.count("trials_rejected")
+        if report is not None:
+            report.writerow(format_row({"trialId": tid, "eye": eye, **row}))
+        present = ~(np.isnan(xs) | np.isnan(ys))
+        if not row["rejected"] and present.any():
+            yield tid, times[present], xs[present], ys[present]
+
+
+def write_samples(trials: Iterator[BinocularArrays], file):
+    """
+    Write trials as CSV in the schema of the input (empty cells for missing
+    coordinates).
+    """
+    file.write(",".join(["time", "trialId", *BINOCULAR_COLUMNS]) + "\n")
+    for tid, times, *coordinates in trials:
+        cells = [np.char.mod("%.2f", column).astype(object) for column in coordinates]
+        for cell, column in zip(cells, coordinates):
+            cell[np.isnan(column)] = ""
+        for t, *values in zip(times.tolist(), *(cell.tolist() for cell in cells)):
+            file.write(f"{t},{tid},{','.join(values)}\n")
+
+
+def open_samples(args: dict) -> Iterator[BinocularArrays]:
+    if args["cache"]:
+        import cache
+        return cache.cached_binocular_arrays(
+            args["input"], args["cache"], keep_missing=True
+        )
+    elif args["input"]:
+        return read_binocular_arrays(
+            open(args["input"], encoding="utf8", newline=""), keep_missing=True
+        )
+    else:
+        return read_binocular_arrays(sys.stdin, keep_missing=True)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Options of the quality stage, shared with fixations.py --preprocess.
+    """
+    parser.add_argument(
+        "--cross",
+        type=float,
+        nargs=2,
+        default=CROSS,
+        metavar=("X", "Y"),
+        help=(
+            "Position of the fixation cross at the start of each trial"
+            " (constants.STIMULUS_START)."
+        ),
+    )
+    parser.add_argument(
+        "--cross-duration",
+        type=float,
+        default=100,
+        help="How long (in ms) the gaze is on the cross at the start of each trial.",
+    )
+    parser.add_argument(
+        "--correct",
+        default="both",
+        choices=CORRECTIONS,
+        help="Which part of the offset from the cross to subtract from each trial.",
+    )
+    parser.add_argument(
+        "--max-gap",
+        type=float,
+        default=75,
+        help="Longest gap of missing samples (in ms) to fill by interpolation.",
+    )
+    parser.add_argument(
+        "--max-dropout",
+        type=float,
+        help="Reject trials with a larger fraction of missing samples.",
+    )
+    parser.add_argument(
+        "--max-accuracy",
+        type=float,
+        help="Reject trials whose offset from the cross is larger (in pixels).",
+    )
+    parser.add_argument(
+        "--max-precision",
+        type=float,
+        help=(
+            "Reject trials whose sample-to-sample RMS on the cross is larger (in"
+            " pixels)."
+        ),
+    )
+
+
+def read_parameters():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure data quality per trial and eye, interpolate short gaps and correct"
+            " the offset from the fixation cross."
+        )
+    )
+    add_arguments(parser)
+    parser.add_argument(
+        "--output",
+        help=(
+            "Write the corrected samples of the trials that were not rejected as CSV to"
+            " this file."
+        ),
+    )
+    parser.add_argument("--input", help="CSV file to read instead of stdin.")
+    parser.add_argument(
+        "--cache",
+        help=(
+            "Directory for a binary cache of the parsed --input file, reused by later"
+            " runs."
+        ),
+    )
+
+    args = parser.parse_args()
+    if args.cache and not args.input:
+        parser.error("--cache needs an --input file")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    output = (
+        open(args["output"], "w", encoding="utf8", newline="")
+        if args["output"]
+        else None
+    )
+    writer = csv.DictWriter(
+        sys.stdout, QUALITY_COLUMNS, delimiter="\t", lineterminator="\n"
+    )
+    writer.writeheader()
+
+    def accepted_trials():
+        for trial, left, right in assess_binocular(open_samples(args), args):
+            writer.writerow(format_row(left))
+            writer.writerow(format_row(right))
+            # A trial is kept if no tracked eye was rejected
+            if not any(row["rejected"] and row["dropout"] < 1 for row in (left, right)):
+                yield trial
+
+    if output is not None:
+        write_samples(accepted_trials(), output)
+        output.close()
+    else:
+        for _ in accepted_trials():
+            pass
@@ -0,0 +1,95 @@
+"""
+Headless rendering of trial plots.
+
+A TrialRenderer keeps one figure for all trials and only swaps the data of
+its artists, so rendering thousands of trials doesn't accumulate figures.
+All fixation circles of a trial are drawn as a single polygon collection
+instead of one patch per fixation. PNGs can be written synchronously, in a
+background thread, or not at all.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+PNG_MODES = ["sync", "async", "off"]
+
+# Unit circle used to build the fixation polygons
+CIRCLE = np.column_stack(
+    [np.cos(np.linspace(0, 2 * np.pi, 32)), np.sin(np.linspace(0, 2 * np.pi, 32))]
+)
+
+
+class TrialRenderer:
+    def __init__(self, png: str = "sync", max_pending: int = 8):
+        # Imported here so that scripts can use PNG_MODES without matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import PolyCollection
+        from matplotlib.figure import Figure
+
+        self.png = png
+        self.figure = Figure()
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.invert_yaxis()
+        (self.gaze,) = self.ax.plot([], [], color="red")
+        (self.path,) = self.ax.plot([], [], color="blue")
+        self.circles = PolyCollection([], facecolors="blue", edgecolors="blue")
+        self.ax.add_collection(self.circles, autolim=False)
+
+        self.writer = ThreadPoolExecutor(1) if png == "async" else None
+        self.pending = deque()
+        self.max_pending = max_pending
+
+    def render(
+        self,
+        filename: str,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        fixation_xs: np.ndarray,
+        fixation_ys: np.ndarray,
+    ):
+        """
+        Plot the gaze path in red and the fixations in blue (with circles
+        sized by duration) and save the plot to filename.
+        """
+        if self.png == "off":
+            return
+
+        self.gaze.set_data(xs, ys)
+        self.path.set_data(fixation_xs, fixation_ys)
+        radii = (np.asarray(ends) - np.asarray(starts)) / 100
+        centers = np.column_stack([fixation_xs, fixation_ys])
+        polygons = centers[:, None, :] + radii[:, None, None] * CIRCLE[None, :, :]
+        self.circles.set_verts(polygons)
+
+        self.ax.relim()
+        if len(polygons):
+            self.ax.update_datalim(polygons.reshape(-1, 2))
+        self.ax.autoscale_view()
+
+        if self.png == "sync":
+            self.figure.savefig(filename)
+            return
+
+        # Draw now, encode and write the PNG in the background
+        from matplotlib.image import imsave
+
+        self.figure.canvas.draw()
+        image = np.array(self.figure.canvas.buffer_rgba())
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.writer.submit(imsave, filename, image))
+
+    def close(self):
+        """
+        Wait for pending PNG writes.
+        """
+        while self.pending:
+            self.pending.popleft().result()
+        if self.writer is not None:
+            self.writer.shutdown()
@@ -0,0 +1,175 @@
+import argparse
+import csv
+import sys
+from typing import List
+
+import numpy as np
+
+from fixations import (
+    dispersion_based_fixations_array,
+    open_trials,
+    sample_velocities,
+    velocity_fixations,
+)
+
+
+def covered_time(starts: np.ndarray, ends: np.ndarray) -> int:
+    """
+    Length of the union of the intervals [start, end], so that overlapping
+    fixations (which the dispersion-based algorithm reports) count once.
+    """
+    if len(starts) == 0:
+        return 0
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    reach_before = np.concatenate(([starts[0]], reach[:-1]))
+    # Every interval adds the time it reaches beyond all the earlier ones
+    return int(np.sum(np.maximum(reach - np.maximum(starts, reach_before), 0)))
+
+
+class Summary:
+    """
+    Running totals of the fixations found with one parameter set.
+    """
+
+    def __init__(self, threshold: float, duration: float = None):
+        self.threshold = threshold
+        self.duration = duration
+        self.trials = 0
+        self.fixations = 0
+        self.fixation_time = 0
+        self.covered_time = 0
+        self.recording_time = 0
+
+    def add(self, times: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.trials += 1
+        self.fixations += len(starts)
+        self.fixation_time += int(np.sum(ends - starts))
+        self.covered_time += covered_time(starts, ends)
+        self.recording_time += int(times[-1] - times[0])
+
+    def row(self) -> list:
+        mean_duration = self.fixation_time / self.fixations if self.fixations else 0
+        # Fraction of the recording time within a fixation
+        coverage = self.covered_time / self.recording_time if self.recording_time else 0
+        duration = "" if self.duration is None else self.duration
+        return [
+            self.threshold,
+            duration,
+            self.trials,
+            self.fixations,
+            f"{mean_duration:.2f}",
+            f"{coverage:.4f}",
+        ]
+
+
+def sweep(trials, args: dict) -> List[Summary]:
+    """
+    Run the detection for every parameter set on every trial, going through
+    the data only once. Intermediate results that don't depend on the
+    thresholds (velocities, data points) are computed once per trial.
+    """
+    if args["mode"] == "velocity":
+        summaries = [Summary(threshold) for threshold in args["thresholds"]]
+    else:
+        durations = args["durations"] or [0.2 / args["freq"]]
+        summaries = [
+            Summary(threshold, duration)
+            for threshold in args["thresholds"]
+            for duration in durations
+        ]
+
+    for tid, times, xs, ys in trials:
+        if args["mode"] == "velocity":
+            pairs, velocity = sample_velocities(times, xs, ys, 1000 / args["freq"])
+            for summary in summaries:
+                starts, ends, _, _ = velocity_fixations(
+                    times, xs, ys, pairs, velocity < summary.threshold
+                )
+                summary.add(times, starts, ends)
+        else:
+            for summary in summaries:
+                fixations = dispersion_based_fixations_array(
+                    times, xs, ys, summary.threshold, summary.duration
+                )
+                summary.add(times, fixations["start"], fixations["end"])
+
+    return summaries
+
+
+def read_parameters():
+    import quality
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Apply dispersion or velocity-based algorithms with a grid of thresholds to"
+            " a eyegaze dataset and summarize the detected fixations per parameter set."
+        )
+    )
+    parser.add_argument(
+        "--mode",
+        default="dispersion",
+        choices=["dispersion", "velocity"],
+        help="Algorithm used for detection.",
+    )
+    parser.add_argument(
+        "--freq", type=int, required=True, help="Sampling frequency of given dataset."
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        required=True,
+        help=(
+            "Dispersion thresholds for dispersion-based mode. Maximum velocity"
+            " thresholds for velocity-based mode."
+        ),
+    )
+    parser.add_argument(
+        "--durations",
+        type=float,
+        nargs="+",
+        help=(
+            "Minimum window sizes (in samples) for dispersion-based mode. Defaults to"
+            " the one fixations.py uses."
+        ),
+    )
+    parser.add_argument(
+        "--eye",
+        default="right",
+        choices=["left", "right"],
+        help="Which eye should be tracked?",
+    )
+    parser.add_argument("--input", help="CSV file to read instead of stdin.")
+    parser.add_argument(
+        "--cache",
+        help=(
+            "Directory for a binary cache of the parsed --input file, reused by later"
+            " runs."
+        ),
+    )
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="Run the quality stage of quality.py before detection.",
+    )
+    quality.add_arguments(parser.add_argument_group("quality stage"))
+
+    args = parser.parse_args()
+    if args.cache and not args.input:
+        parser.error("--cache needs an --input file")
+    return vars(args)
+
+
+if __name__ == "__main__":
+    args = read_parameters()
+
+    summaries = sweep(open_trials(args), args)
+
+    writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+    writer.writerow(
+        ["threshold", "duration", "trials", "fixations", "mean_duration", "coverage"]
+    )
+    for summary in summaries:
+        writer.writerow(summary.row())
@@ -0,0 +1,155 @@
+"""
+Deterministic synthetic gaze data for benchmarks and checks.
+
+The traces look like reading: fixations of random duration on a line of
+text, connected by saccades that mostly go to the right, with occasional
+regressions and return sweeps to the start of the next line. Sensor noise
+and dropped samples are added on top. The same parameters and seed always
+give the same data.
+"""
+
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from fixations import DataPoint
+
+
+class GazeParameters(NamedTuple):
+    freq: int = 60  # Hz
+    fixation_duration: float = 0.225  # mean, in seconds
+    fixation_sd: float = 0.075  # in seconds
+    saccade_amplitude: float = 120  # mean, in pixels
+    saccade_speed: float = 5000  # pixels per second, on top of 20 ms per saccade
+    regressions: float = 0.1  # fraction of saccades going to the left
+    noise: float = 2.0  # standard deviation of the sensor noise, in pixels
+    dropout: float = 0.02  # fraction of missing samples
+    dropout_length: float = 0  # mean length of a run of missing samples, in seconds
+    line_start: Tuple[float, float] = (300, 540)
+    line_end: float = 1700
+    line_height: float = 50
+    lines_per_page: int = 10
+
+
+def synthetic_gaze(
+    parameters: GazeParameters, seconds: float, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Times (in ms) and noisy gaze positions of a synthetic trial, without
+    dropout.
+    """
+    rng = np.random.default_rng(seed)
+    freq = parameters.freq
+    n = int(seconds * freq)
+    # Every fixation with its saccade lasts at least 70 ms
+    events = int(seconds / 0.07) + 2
+
+    fixation_samples = np.maximum(
+        1,
+        np.round(
+            np.maximum(
+                0.05,
+                rng.normal(
+                    parameters.fixation_duration, parameters.fixation_sd, events
+                ),
+            )
+            * freq
+        ).astype(int),
+    )
+    amplitudes = np.abs(
+        rng.normal(
+            parameters.saccade_amplitude, parameters.saccade_amplitude / 2, events
+        )
+    )
+    amplitudes[rng.random(events) < parameters.regressions] *= -1
+    saccade_durations = 0.02 + np.abs(amplitudes) / parameters.saccade_speed
+    saccade_samples = np.maximum(1, np.round(saccade_durations * freq).astype(int))
+
+    # Fixation targets along lines of text
+    start_x, start_y = parameters.line_start
+    line_width = parameters.line_end - start_x
+    offsets = np.maximum(np.cumsum(np.concatenate(([0], amplitudes[:-1]))), 0)
+    # After the last line of a page, reading starts again at the top
+    lines = (offsets // line_width).astype(int) % parameters.lines_per_page
+    target_x = start_x + offsets % line_width
+    target_y = start_y + lines * parameters.line_height + rng.normal(0, 5, events)
+
+    # Per sample: index of its event and progress within a saccade
+    lengths = np.column_stack([fixation_samples, saccade_samples]).reshape(-1)
+    segment = np.repeat(np.arange(len(lengths)), lengths)[:n]
+    position = (
+        np.arange(len(segment)) - np.repeat(np.cumsum(lengths) - lengths, lengths)[:n]
+    )
+    event = segment // 2
+    in_saccade = segment % 2 == 1
+    next_event = np.minimum(event + 1, events - 1)
+    progress = np.where(in_saccade, (position + 1) / saccade_samples[event], 0)
+
+    xs = target_x[event] + (target_x[next_event] - target_x[event]) * progress
+    ys = target_y[event] + (target_y[next_event] - target_y[event]) * progress
+    xs += rng.normal(0, parameters.noise, len(xs))
+    ys += rng.normal(0, parameters.noise, len(ys))
+    times = np.arange(len(xs)) * 1000 // freq
+    return times, xs, ys
+
+
+def dropout_mask(parameters: GazeParameters, n: int, seed: int = 0) -> np.ndarray:
+    """
+    True for every sample that is missing. With dropout_length, samples go
+    missing in runs of that mean length (like blinks) instead of one by one.
+    """
+    rng = np.random.default_rng(seed)
+    run_length = max(1.0, parameters.dropout_length * parameters.freq)
+    if run_length == 1:
+        return rng.random(n) < parameters.dropout
+    starts = rng.random(n) < parameters.dropout / run_length
+    lengths = rng.geometric(1 / run_length, n)
+    # Each sample is missing if a run started within its reach
+    ends = np.where(starts, np.arange(n) + lengths, 0)
+    return np.maximum.accumulate(ends) > np.arange(n)
+
+
+def synthetic_trial(
+    freq: int, seconds: float, seed: int = 0, **parameters
+) -> List[DataPoint]:
+    """
+    A synthetic trial as a list of data points, without missing samples.
+    """
+    times, xs, ys = synthetic_gaze(
+        GazeParameters(freq=freq, **parameters), seconds, seed
+    )
+    return list(zip(times.tolist(), xs.tolist(), ys.tolist()))
+
+
+def synthetic_csv(
+    parameters: GazeParameters, seconds: float, trials: int, seed: int = 0
+) -> str:
+    """
+    Synthetic trials in the CSV schema read_trials() expects. The left eye
+    is a shifted copy of the right one with its own noise and dropout.
+    """
+    rng = np.random.default_rng(seed)
+    lines = ["time,trialId,x_left,y_left,x_right,y_right"]
+    for trial_id in range(trials):
+        times, xs, ys = synthetic_gaze(parameters, seconds, seed=seed + trial_id)
+        left_xs = xs + 3 + rng.normal(0, parameters.noise / 2, len(xs))
+        left_ys = ys - 2 + rng.normal(0, parameters.noise / 2, len(ys))
+        left_missing = dropout_mask(
+            parameters, len(xs), seed=2 * (seed + trial_id) + 1
+        ).tolist()
+        right_missing = dropout_mask(
+            parameters, len(xs), seed=2 * (seed + trial_id)
+        ).tolist()
+        for t, left_x, left_y, x, y, no_left, no_right in zip(
+            times.tolist(),
+            left_xs.tolist(),
+            left_ys.tolist(),
+            xs.tolist(),
+            ys.tolist(),
+            left_missing,
+            right_missing,
+        ):
+            left = ",," if no_left else f",{left_x:.2f},{left_y:.2f}"
+            right = ",," if no_right else f",{x:.2f},{y:.2f}"
+            lines.append(f"{t},{trial_id}{left}{right}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from detectors import DETECTORS, adaptive_threshold, smoothed_velocities
+from synthetic import GazeParameters, synthetic_gaze
+
+
+def fixation_count(mode, freq, seconds, seed):
+    times, xs, ys = synthetic_gaze(GazeParameters(freq=freq), seconds, seed)
+    args = {"mode": mode, "freq": freq, "threshold": None}
+    return len(DETECTORS[mode].function(times, xs, ys, args))
+
+
+@pytest.mark.parametrize("freq", [250, 500, 1000, 2000])
+@pytest.mark.parametrize("seed", range(4))
+def test_adaptive_finds_the_fixations(freq, seed):
+    # 4 s of synthetic reading hold 14 to 17 fixations of 50 ms or more
+    count = fixation_count("adaptive", freq, 4, seed)
+    assert 12 <= count <= 18
+    assert abs(count - fixation_count("hmm", freq, 4, seed)) <= 2
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_adaptive_threshold_stays_below_saccades(seed):
+    times, xs, ys = synthetic_gaze(GazeParameters(freq=500), 4, seed)
+    _, velocity = smoothed_velocities(times, xs, ys, 500)
+    peak, onset = adaptive_threshold(velocity)
+    # A saccade of the mean amplitude (120 px in 44 ms) averages 2.7 px/ms
+    assert onset < peak < 1
+    assert peak > np.median(velocity)
+
+
+@pytest.mark.parametrize("freq", [60, 250, 1000])
+@pytest.mark.parametrize("seed", range(4))
+def test_adaptive_on_quantized_gaze(freq, seed):
+    # With little noise and integer positions, most velocities are exactly 0
+    times, xs, ys = synthetic_gaze(GazeParameters(freq=freq, noise=0.2), 4, seed)
+    xs, ys = np.round(xs), np.round(ys)
+    args = {"mode": "adaptive", "freq": freq, "threshold": None}
+    assert 12 <= len(DETECTORS["adaptive"].function(times, xs, ys, args)) <= 18
+
+
+def test_adaptive_on_noise_free_plateaus():
+    times = np.arange(0, 400, 2)
+    xs = np.where(times < 200, 100.0, 300.0)
+    ys = np.full(len(times), 500.0)
+    args = {"mode": "adaptive", "freq": 500, "threshold": None}
+    fixations = DETECTORS["adaptive"].function(times, xs, ys, args)
+    assert fixations["x"].tolist() == [100, 300]
+    assert fixations["start"][1] > 198 and fixations["end"][0] < 200
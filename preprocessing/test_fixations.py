@@ -0,0 +1,106 @@
+import io
+
+import numpy as np
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from fixations import (
+    fixation_list,
+    read_trial_arrays,
+    read_trials,
+    split_fields,
+    velocity_based_fixations,
+    velocity_based_fixations_array,
+)
+
+# Timestamps of 0 are skipped by the velocity-based algorithm, so they are
+# drawn often. Integer positions with time_diff 1 make velocities equal to the
+# threshold exactly, to test ties.
+timestamps = st.one_of(st.just(0), st.integers(1, 10000))
+positions = st.integers(0, 20).map(float)
+samples = st.lists(st.tuples(timestamps, positions, positions), max_size=60)
+time_diffs = st.sampled_from([1, 0.5, 1000 / 60])
+
+
+def assert_equivalent(points, max_velocity, time_diff):
+    reference = list(velocity_based_fixations(points, max_velocity, time_diff))
+    times, xs, ys = np.array(points, dtype=float).reshape(-1, 3).T
+    vectorized = fixation_list(
+        velocity_based_fixations_array(
+            times.astype(np.int64), xs, ys, max_velocity, time_diff
+        )
+    )
+    assert len(vectorized) == len(reference)
+    for (start, end, x, y), expected in zip(vectorized, reference):
+        assert (start, end) == expected[:2]
+        assert (x, y) == pytest.approx(expected[2:])
+
+
+@given(samples, st.floats(0, 10), time_diffs)
+def test_velocity_array_matches_generator(points, max_velocity, time_diff):
+    assert_equivalent(points, max_velocity, time_diff)
+
+
+@given(samples, st.integers(0, 20))
+def test_velocity_array_matches_generator_at_ties(points, max_velocity):
+    assert_equivalent(points, float(max_velocity), 1)
+
+
+@given(
+    st.lists(st.tuples(st.just(0), positions, positions), max_size=20),
+    st.floats(0, 10),
+)
+def test_velocity_zero_timestamps(points, max_velocity):
+    assert_equivalent(points, max_velocity, 1)
+
+
+@pytest.mark.parametrize("points", [[], [(5, 1.0, 1.0)], [(0, 1.0, 1.0)]])
+def test_velocity_short_trials(points):
+    assert_equivalent(points, 10, 1)
+    assert list(velocity_based_fixations(points, 10, 1)) == []
+
+
+def test_velocity_tie_is_a_saccade():
+    points = [(1, 0.0, 0.0), (2, 3.0, 0.0), (3, 3.0, 1.0), (4, 3.0, 2.0)]
+    assert_equivalent(points, 3, 1)
+    assert list(velocity_based_fixations(points, 3, 1)) == [(2, 4, 3.0, 1.0)]
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        ["1,2,3\n", "4,5,6\r\n", "7,8,9"],
+        ["1,2,3\n", "\n", "4,5,6\n", "7,8,9\n"],
+        ['1,"2",3\n', "4,5,6\n", "7,8,9\n"],
+    ],
+)
+def test_split_fields(lines):
+    assert split_fields(lines, 3) == list("123456789")
+
+
+def test_split_fields_ragged_lines():
+    # As many fields as three full lines, but not in the right places
+    lines = ["1,2,3\n", "4,5\n", "6,7,8,9\n"]
+    assert split_fields(lines, 3) == ["1", "2", "3", "4", "5", "", "6", "7", "8"]
+
+
+CSV = """time,trialId,x_left,y_left,x_right,y_right
+0,1,1.0,2.0,3.0,4.0
+2,1,,,5.0,6.0
+4,2,1.5,2.5,,
+6,2,1.0,2.0,3.0,4.0
+"""
+
+
+def test_read_trials_yields_the_last_trial():
+    trials = list(read_trials(io.StringIO(CSV), "right"))
+    assert trials == [
+        ("1", [(0, 3.0, 4.0), (2, 5.0, 6.0)]),
+        ("2", [(6, 3.0, 4.0)]),
+    ]
+    columnar = [
+        (trial_id, list(zip(times.tolist(), xs.tolist(), ys.tolist())))
+        for trial_id, times, xs, ys in read_trial_arrays(io.StringIO(CSV), "right")
+    ]
+    assert columnar == trials
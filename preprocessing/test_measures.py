@@ -0,0 +1,137 @@
+import io
+
+import numpy as np
+from hypothesis import given
+from hypothesis import strategies as st
+
+from measures import MEASURES, measure_table, read_table, reading_measures
+
+
+def reference_measures(fixations):
+    """
+    FPRT, TFT, FPR and RPD of every fixated ROI of one trial, given its
+    fixations as (roi, duration) in temporal order, computed naively.
+    """
+    measures = {}
+    for roi in sorted({roi for roi, _ in fixations}):
+        tft = sum(duration for other, duration in fixations if other == roi)
+        first = next(i for i, (other, _) in enumerate(fixations) if other == roi)
+        if any(other > roi for other, _ in fixations[:first]):
+            measures[roi] = (0, tft, 0, 0)
+            continue
+        end = first
+        while end < len(fixations) and fixations[end][0] == roi:
+            end += 1
+        fprt = sum(duration for _, duration in fixations[first:end])
+        fpr = int(end < len(fixations) and fixations[end][0] < roi)
+        path_end = first
+        while path_end < len(fixations) and fixations[path_end][0] <= roi:
+            path_end += 1
+        rpd = sum(duration for _, duration in fixations[first:path_end])
+        measures[roi] = (fprt, tft, fpr, rpd)
+    return measures
+
+
+fixation = st.tuples(st.integers(0, 5), st.integers(50, 400))
+trials = st.lists(st.lists(fixation, max_size=12), min_size=1, max_size=6)
+
+
+@given(trials)
+def test_reading_measures_match_reference(trial_fixations):
+    codes, rois, durations = [], [], []
+    expected = {}
+    for code, fixations in enumerate(trial_fixations):
+        for roi, duration in fixations:
+            codes.append(code)
+            rois.append(roi)
+            durations.append(duration)
+        for roi, values in reference_measures(fixations).items():
+            expected[code, roi] = values
+
+    measures = reading_measures(
+        np.array(codes, int), np.array(rois, int), np.array(durations, int)
+    )
+    found = {
+        (trial, roi): (fprt, tft, fpr, rpd)
+        for trial, roi, fprt, tft, fpr, rpd in zip(
+            *(column.tolist() for column in measures)
+        )
+    }
+    assert found == expected
+
+
+def test_skipped_roi_and_regression_at_trial_boundary():
+    # Trial 0 reads 0, skips 1, regresses from 2 to 1; trial 1 starts on 0
+    measures = reading_measures(
+        [0, 0, 0, 0, 1, 1], [0, 2, 1, 2, 0, 1], [100, 200, 50, 70, 80, 90]
+    )
+    rows = list(zip(*(column.tolist() for column in measures)))
+    assert rows == [
+        (0, 0, 100, 100, 0, 100),
+        (0, 1, 0, 50, 0, 0),
+        (0, 2, 200, 270, 1, 320),
+        # The last fixation of trial 0 (ROI 2) is no regression out of ROI 0
+        (1, 0, 80, 80, 0, 80),
+        (1, 1, 90, 90, 0, 90),
+    ]
+
+
+# ROIs as logged: indices, or -1, NA or empty for fixations outside all ROIs
+logged_roi = st.sampled_from(["0", "1", "2", "3", "-1", "NA", ""])
+logged_trials = st.lists(
+    st.tuples(
+        st.sampled_from(["1", "2"]),
+        st.sampled_from(["1", "2", "3"]),
+        st.sampled_from(["a", "b"]),
+    ),
+    min_size=1,
+    max_size=4,
+    unique=True,
+)
+
+
+@given(logged_trials, st.data())
+def test_measure_table_matches_reference(labels, data):
+    rows = []
+    sequences = {}
+    for subj, item, cond in labels:
+        fixations = data.draw(
+            st.lists(st.tuples(logged_roi, st.integers(50, 400)), max_size=10)
+        )
+        start = 0
+        for roi, duration in fixations:
+            rows.append((subj, item, cond, start, start + duration, roi))
+            start += duration + 30
+        sequences[subj, item, cond] = [
+            (int(roi), duration)
+            for roi, duration in fixations
+            if roi not in ("-1", "NA", "")
+        ]
+    # The table sorts the fixations by trial and start time itself
+    rows = data.draw(st.permutations(rows))
+    text = "subj\titem\tcond\tstart\tend\troi\n" + "".join(
+        "\t".join(map(str, row)) + "\n" for row in rows
+    )
+    table = measure_table(read_table(io.StringIO(text)))
+
+    item_rois = {}
+    for (_, item, _), fixations in sequences.items():
+        item_rois.setdefault(item, set()).update(roi for roi, _ in fixations)
+    expected = {}
+    for (subj, item, cond), fixations in sequences.items():
+        if not any(row[:3] == (subj, item, cond) for row in rows):
+            continue
+        measures = reference_measures(fixations)
+        for roi in item_rois[item]:
+            expected[subj, item, cond, roi] = measures.get(roi, (0, 0, 0, 0))
+
+    found = {
+        (subj, item, cond, roi): tuple(values)
+        for subj, item, cond, roi, *values in zip(
+            *(
+                table[column].tolist()
+                for column in ["subj", "item", "cond", "roi"] + MEASURES
+            )
+        )
+    }
+    assert found == expected
@@ -0,0 +1,67 @@
+import pytest
+
+from fixations import incremental_dispersion_based_fixations
+from online import DispersionDetector, OnlineFixationDetector
+from synthetic import GazeParameters, synthetic_gaze, synthetic_trial
+
+
+def online_events(detector, points):
+    online = OnlineFixationDetector(detector)
+    events = []
+    for point in points:
+        events.extend(online.push(point))
+    events.extend(online.finish())
+    return events
+
+
+def steady_gaze(start, samples, x, y):
+    return [(start + 2 * i, x + (i % 3), y - (i % 2)) for i in range(samples)]
+
+
+def gaze_detector():
+    # The settings of experiment/gaze.py: 25 px and 150 ms
+    return DispersionDetector(25, 150, restart=True, timed=True)
+
+
+def test_restart_reports_every_fixation_once():
+    points = steady_gaze(0, 100, 300, 540) + steady_gaze(200, 100, 500, 540)
+    events = online_events(gaze_detector(), points)
+    assert [event.type for event in events] == ["start", "end", "start", "end"]
+    assert (events[1].start_time, events[1].end_time) == (0, 198)
+    assert (events[3].start_time, events[3].end_time) == (200, 398)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_restart_fixations_dont_overlap(seed):
+    times, xs, ys = synthetic_gaze(GazeParameters(freq=500), 10, seed)
+    points = zip(times.tolist(), xs.tolist(), ys.tolist())
+    events = online_events(gaze_detector(), points)
+
+    assert [event.type for event in events] == ["start", "end"] * (len(events) // 2)
+    starts, ends = events[0::2], events[1::2]
+    for start, end in zip(starts, ends):
+        assert start.start_time == end.start_time
+    for previous, start in zip(ends, starts[1:]):
+        assert start.start_time > previous.end_time
+    # The 10 s hold about 37 fixations, a few of them shorter than 150 ms
+    assert 30 <= len(ends) <= 42
+
+
+def test_timed_duration_doesnt_depend_on_the_sample_rate():
+    # A loop that only gets every fifth sample still sees the same fixations
+    points = steady_gaze(0, 100, 300, 540)
+    events = online_events(gaze_detector(), points[::5])
+    assert [event.type for event in events] == ["start", "end"]
+    assert events[0].start_time == 0
+    assert (events[1].start_time, events[1].end_time) == (0, 190)
+    # Starts are reported as soon as 150 ms of samples are in the window
+    online = OnlineFixationDetector(gaze_detector())
+    pushed = [online.push(point) for point in points[::5]]
+    assert [len(events) for events in pushed].index(1) == 15
+
+
+def test_sliding_window_matches_generator():
+    points = synthetic_trial(500, 5, seed=1)
+    events = online_events(DispersionDetector(25, 75), points)
+    ends = [event[1:] for event in events if event.type == "end"]
+    assert ends == list(incremental_dispersion_based_fixations(points, 25, 75))
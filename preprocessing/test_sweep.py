@@ -0,0 +1,35 @@
+import numpy as np
+from hypothesis import given
+from hypothesis import strategies as st
+
+from sweep import covered_time, sweep
+from synthetic import GazeParameters, synthetic_gaze
+
+intervals = st.lists(st.tuples(st.integers(0, 50), st.integers(0, 20)), max_size=10)
+
+
+@given(intervals)
+def test_covered_time_counts_overlaps_once(spans):
+    starts = np.array([start for start, _ in spans], dtype=np.int64)
+    ends = starts + np.array([length for _, length in spans], dtype=np.int64)
+    covered = np.zeros(100, dtype=bool)
+    for start, end in zip(starts, ends):
+        covered[start:end] = True
+    assert covered_time(starts, ends) == covered.sum()
+
+
+def test_dispersion_coverage_is_a_fraction():
+    trials = []
+    for seed in range(3):
+        times, xs, ys = synthetic_gaze(GazeParameters(freq=500), 4, seed)
+        trials.append((str(seed), times, xs, ys))
+    args = {
+        "mode": "dispersion",
+        "freq": 500,
+        "thresholds": [10, 40],
+        "durations": [1, 50],
+    }
+    for summary in sweep(trials, args):
+        # Overlapping windows make the summed fixation time exceed the recording
+        coverage = float(summary.row()[-1])
+        assert 0 < coverage <= 1